@@ -0,0 +1,3 @@
+"""
+Benchmarks of Enpyclopedia against a local mock MediaWiki server. Run them with python -m benchmarks.run
+"""
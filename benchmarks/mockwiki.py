@@ -0,0 +1,310 @@
+"""
+Local stand-in for a MediaWiki site (api.php, article html and images), used by the benchmarks.
+It serves pages from a fixtures file (recorded from Wikipedia with record_fixtures(), or generated
+with generate_fixtures()), answering the queries Enpyclopedia makes in the same format as the API.
+Every response can be delayed to simulate the latency of a real server.
+"""
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from html import escape
+from enpyclopedia.dump import wikitext_sections
+from enpyclopedia.store import normalize_title
+
+HEADING_LINE_RE = re.compile(r"^(={2,6})(.+?)\1\s*$", re.MULTILINE)
+WORDS = "the of and in to was is for on as by with he that at from his it an were are which this also be or has had first one their its new after but who not they have her she two been other when there all during into school time may years more most only over city some world would where later up such used many can state about national out known university united then made".split()
+
+def generate_fixtures(pages=50, sections=8, paragraphs=3, images=6, categories=10, seed=0) -> dict:
+    """
+    Generates synthetic fixtures with articles about the size of an average Wikipedia article.
+    The same arguments always give the same fixtures, so results can be compared between runs.
+    """
+    rng = random.Random(seed)
+
+    def sentence():
+        words = rng.choices(WORDS, k=rng.randint(8, 25))
+        return " ".join(words).capitalize() + "."
+
+    def paragraph():
+        return " ".join(sentence() for _ in range(rng.randint(3, 7)))
+
+    fixtures = {"pages": []}
+    for i in range(1, pages + 1):
+        text = [ paragraph() for _ in range(paragraphs) ]
+        for s in range(1, sections + 1):
+            level = "==" if s == 1 or rng.random() < 0.6 else "==="
+            text.append(f"{level} Section {s} {rng.choice(WORDS)} {level}")
+            text.extend(paragraph() for _ in range(paragraphs))
+        cats = sorted(set(f"Category:Topic {rng.randrange(categories)}" for _ in range(3)))
+        text.extend(f"[[{c}]]" for c in cats)
+        fixtures["pages"].append({
+            "title": f"Article {i}",
+            "ns": 0,
+            "pageid": i,
+            "text": "\n\n".join(text) + "\n",
+            "categories": cats,
+            "images": [ f"Image_{rng.randrange(pages * images)}.jpg" for _ in range(images) ],
+            "langlinks": [ ["fr", f"Article {i} (fr)"], ["de", f"Artikel {i}"] ],
+            "redirects": [ f"Article {i} (redirect)" ] if i % 5 == 0 else []
+        })
+    for c in range(categories):
+        fixtures["pages"].append({"title": f"Category:Topic {c}", "ns": 14, "pageid": 100000 + c, "text": f"Articles about topic {c}.\n", "categories": [], "images": [], "langlinks": [], "redirects": []})
+    return fixtures
+
+def record_fixtures(titles, path: str, transport=None):
+    """
+    Records the pages with the given titles from Wikipedia (or the site of the transport) into a fixtures file.
+    """
+    from enpyclopedia import Enpyclopedia, get_html, get_wiki_text, get_categories, get_other_languages
+    enc = Enpyclopedia(transport=transport)
+    fixtures = {"pages": []}
+    for title, page in enc.find_many(titles).items():
+        if page is None:
+            continue
+        html = get_html(page.fullurl, enc.transport)
+        fixtures["pages"].append({
+            "title": page.title,
+            "ns": page.ns,
+            "pageid": page.pageid,
+            "text": get_wiki_text(page, "wikitext", enc.transport),
+            "categories": [ c.title for c in get_categories(page, enc.transport) or [] ],
+            "images": [ urllib.parse.unquote(img["src"].rsplit("/", 1)[-1]) for img in html.find_all("img") if img.get("src") ],
+            "langlinks": [ [link.split(".")[0].split("//")[1], urllib.parse.unquote(link.rsplit("/", 1)[-1])] for link in get_other_languages(page, enc.transport) ],
+            "redirects": [ r.title for r in page.redirects or [] ]
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixtures, f, ensure_ascii=False)
+
+class MockWiki:
+    """
+    Threaded HTTP server answering like a MediaWiki site. It counts the requests it serves and the bytes it sends.
+    """
+
+    def __init__(self, fixtures: dict, latency=0.0, image_size=32 * 1024, compress=True, port=0):
+        """
+        @arg latency: Seconds every response is delayed.
+        @arg image_size: Size of every image served.
+        @arg compress: If True, responses are gzip-compressed when the client accepts it, like Wikipedia does.
+        """
+        self.latency = latency
+        self.image_size = image_size
+        self.compress = compress
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self.pages = {} # Title -> page
+        self.redirects = {} # Title of a redirect -> title of its target
+        for page in fixtures["pages"]:
+            page = dict(page)
+            page["sections"] = wikitext_sections(page["title"], page["text"])
+            self.pages[page["title"]] = page
+            for redirect in page.get("redirects", []):
+                self.redirects[redirect] = page["title"]
+        self.by_id = { p["pageid"]: t for t, p in self.pages.items() }
+        self.redirect_ids = { r: 1000000 + i for i, r in enumerate(self.redirects) }
+        self.members = {} # Category -> titles of its members
+        for title, page in self.pages.items():
+            for category in page.get("categories", []):
+                self.members.setdefault(category, []).append(title)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(self))
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.api_url = self.url + "/w/api.php"
+
+    def start(self) -> "MockWiki":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "bytes": self.bytes_sent}
+
+    def _count(self, size: int):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    # @info Responses, in the same format as the API
+
+    def _info(self, title: str) -> dict:
+        page = self.pages[title]
+        url = f"{self.url}/wiki/{urllib.parse.quote(title.replace(' ', '_'))}"
+        info = {"pageid": page["pageid"], "ns": page["ns"], "title": title, "contentmodel": "wikitext", "pagelanguage": "en",
+                "pagelanguagehtmlcode": "en", "pagelanguagedir": "ltr", "touched": "2024-01-01T00:00:00Z", "lastrevid": page["pageid"] * 10,
+                "length": len(page["text"].encode("utf-8")), "talkid": page["pageid"] + 1, "fullurl": url, "editurl": f"{url}?action=edit", "canonicalurl": url}
+        return info
+
+    def _redirect_info(self, title: str) -> dict:
+        url = f"{self.url}/wiki/{urllib.parse.quote(title.replace(' ', '_'))}"
+        return {"pageid": self.redirect_ids[title], "ns": 0, "title": title, "contentmodel": "wikitext", "pagelanguage": "en", "pagelanguagehtmlcode": "en",
+                "pagelanguagedir": "ltr", "touched": "2024-01-01T00:00:00Z", "lastrevid": self.redirect_ids[title] * 10, "length": 30, "redirect": "",
+                "fullurl": url, "editurl": f"{url}?action=edit", "canonicalurl": url}
+
+    def query(self, q: dict) -> dict:
+        res = {"batchcomplete": ""}
+        query = {}
+        if q.get("list") == "categorymembers":
+            members = self.members.get(q["cmtitle"], [])
+            if q.get("cmtype") == "subcat":
+                members = [ m for m in members if self.pages[m]["ns"] == 14 ]
+            limit = 500 if q.get("cmlimit", "max") == "max" else int(q["cmlimit"])
+            start = int(q.get("cmcontinue", 0))
+            query["categorymembers"] = [ {"pageid": self.pages[m]["pageid"], "ns": self.pages[m]["ns"], "title": m} for m in members[start:start + limit] ]
+            if start + limit < len(members):
+                res["continue"] = {"cmcontinue": str(start + limit), "continue": "-||"}
+        if "titles" in q or "pageids" in q:
+            ids = { v: k for k, v in self.redirect_ids.items() }
+            titles = q["titles"].split("|") if "titles" in q else [ self.by_id.get(int(i)) or ids.get(int(i), "") for i in q["pageids"].split("|") ]
+            props = q.get("prop", "").split("|")
+            normalized, redirects, pages = [], [], {}
+            for missing, title in enumerate(titles, 1):
+                target = normalize_title(title)
+                if target != title:
+                    normalized.append({"from": title, "to": target})
+                if target in self.redirects:
+                    if "redirects" not in q:
+                        pages[str(self.redirect_ids[target])] = self._redirect_info(target) if "info" in props else {"pageid": self.redirect_ids[target], "ns": 0, "title": target}
+                        continue
+                    redirects.append({"from": target, "to": self.redirects[target]})
+                    target = self.redirects[target]
+                page = self.pages.get(target)
+                if page is None:
+                    pages[str(-missing)] = {"ns": 0, "title": target, "missing": ""}
+                    continue
+                pg = self._info(target) if "info" in props else {"pageid": page["pageid"], "ns": page["ns"], "title": target}
+                if "redirects" in props and page.get("redirects"):
+                    pg["redirects"] = [ {"pageid": self.redirect_ids[r], "ns": 0, "title": r} for r in page["redirects"] ]
+                if "categories" in props:
+                    pg["categories"] = [ {"ns": 14, "title": c} for c in page.get("categories", []) ]
+                if "langlinks" in props:
+                    pg["langlinks"] = [ {"lang": lang, "*": t} for lang, t in page.get("langlinks", []) ]
+                if "extracts" in props:
+                    pg["extract"] = page["text"][:page["sections"][0]["byteoffset"]] if page["sections"] else page["text"]
+                pages[str(page["pageid"])] = pg
+            if normalized:
+                query["normalized"] = normalized
+            if redirects:
+                query["redirects"] = redirects
+            query["pages"] = pages
+        res["query"] = query
+        return res
+
+    def parse(self, q: dict) -> dict:
+        title = normalize_title(q.get("page", ""))
+        page = self.pages.get(title)
+        if page is None:
+            return {"error": {"code": "missingtitle", "info": "The page you specified doesn't exist."}}
+        props = q.get("prop", "").split("|")
+        text = page["text"]
+        sections = page["sections"]
+        if q.get("section"):
+            text = _section_wikitext(text, int(q["section"]))
+            sections = []
+        parsed = {"title": title, "pageid": page["pageid"]}
+        if "sections" in props:
+            parsed["sections"] = sections
+        if "wikitext" in props:
+            parsed["wikitext"] = {"*": text}
+        if "text" in props:
+            parsed["text"] = {"*": f'<div class="mw-content-ltr mw-parser-output" lang="en" dir="ltr">{_render(text)}</div>'}
+        return {"parse": parsed}
+
+    def article(self, title: str) -> str:
+        shown = self.redirects.get(title, title)
+        page = self.pages.get(shown)
+        if page is None:
+            return None
+        redirected = f'<span class="mw-redirectedfrom">(Redirected from {escape(title)})</span>' if shown != title else ""
+        images = "".join(f'<img src="/images/{urllib.parse.quote(name)}" width="220">' for name in page.get("images", []))
+        return (f'<!DOCTYPE html><html><head><title>{escape(shown)}</title></head><body><h1 id="firstHeading" class="firstHeading">{escape(shown)}</h1>'
+                f'{redirected}<div id="mw-content-text"><div class="mw-parser-output">{images}{_render(page["text"])}</div></div></body></html>')
+
+    def image(self, name: str) -> bytes:
+        seed = name.encode("utf-8") * (self.image_size // max(1, len(name)) + 1)
+        return b"\xff\xd8\xff\xe0" + seed[:self.image_size - 4]
+
+def _section_wikitext(wikitext: str, index: int) -> str:
+    """
+    Wikitext of a section (0 is the text before the first heading), found line by line the way MediaWiki does,
+    rather than with the byte offsets Enpyclopedia splits pages with, so the two can be compared.
+    """
+    lines = wikitext.split("\n")
+    headings = [ (i, len(match.group(1))) for i, match in ((i, HEADING_LINE_RE.match(line)) for i, line in enumerate(lines)) if match ]
+    if index == 0:
+        start, end = 0, headings[0][0] if headings else len(lines)
+    else:
+        start, level = headings[index - 1]
+        end = next((i for i, other in headings[index:] if other <= level), len(lines))
+    return "\n".join(lines[start:end]).rstrip()
+
+def _render(wikitext: str) -> str:
+    """
+    Very rough html rendering of wikitext: headings and paragraphs, enough to have realistic sizes.
+    """
+    def heading(match):
+        level = len(match.group(1))
+        line = match.group(2).strip()
+        return f'<div class="mw-heading mw-heading{level}"><h{level} id="{escape(line.replace(" ", "_"))}">{escape(line)}</h{level}></div>'
+    html = HEADING_LINE_RE.sub(heading, escape(wikitext, quote=False))
+    blocks = [ block.strip() for block in html.split("\n\n") if block.strip() ]
+    return "".join(block if block.startswith("<div") else f"<p>{block}</p>" for block in blocks)
+
+def _make_handler(wiki: MockWiki):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True # Headers and body are written separately, Nagle's algorithm would delay the body
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, body, content_type="application/json", status=200, headers=None):
+            body = body.encode("utf-8") if isinstance(body, str) else body
+            compressed = wiki.compress and "gzip" in self.headers.get("Accept-Encoding", "") and not content_type.startswith("image/")
+            if compressed:
+                body = gzip.compress(body, compresslevel=1)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if compressed:
+                self.send_header("Content-Encoding", "gzip")
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            if self.command == "HEAD":
+                wiki._count(0)
+                return
+            self.wfile.write(body)
+            wiki._count(len(body))
+
+        def do_HEAD(self):
+            # @info Same headers as a GET, without the body
+            self.do_GET()
+
+        def do_GET(self):
+            if wiki.latency:
+                time.sleep(wiki.latency)
+            url = urllib.parse.urlsplit(self.path)
+            q = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+            if url.path.startswith("/wiki/"):
+                html = wiki.article(urllib.parse.unquote(url.path[len("/wiki/"):]).replace("_", " "))
+                return self.send(html, "text/html") if html is not None else self.send("Not found", "text/html", 404)
+            if url.path.startswith("/images/"):
+                body = wiki.image(urllib.parse.unquote(url.path[len("/images/"):]))
+                start = int(self.headers["Range"].split("=")[1].rstrip("-")) if self.headers.get("Range") else 0
+                return self.send(body[start:], "image/jpeg", 206 if start else 200)
+            if url.path == "/w/api.php" and q.get("action") == "query":
+                return self.send(json.dumps(wiki.query(q)))
+            if url.path == "/w/api.php" and q.get("action") == "parse":
+                return self.send(json.dumps(wiki.parse(q)))
+            self.send(json.dumps({"error": {"code": "badvalue", "info": "Unsupported request."}}), status=400)
+
+    return Handler
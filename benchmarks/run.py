@@ -0,0 +1,214 @@
+"""
+Benchmark harness. It starts a MockWiki server and measures, for every scenario, the operations and
+requests per second, the p50/p99 latency of each operation, the bytes transferred and the peak memory used.
+Results are written as JSON, and can be compared against a previous run to catch regressions:
+
+    python -m benchmarks.run --latency 0.02 --output results.json
+    python -m benchmarks.run --latency 0.02 --baseline results.json
+"""
+import argparse
+import json
+import logging
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from enpyclopedia import Enpyclopedia, RateLimiter, WikipediaEntry, WikipediaTransport, download_images, get_all_imgs, get_sections, get_wiki_text, iter_category_members
+from .mockwiki import MockWiki, generate_fixtures
+
+LOGGER = logging.getLogger(__name__)
+_DIRECTORIES = [] # Temporary directories created by the scenarios, removed once they are done
+
+# @info Every scenario takes a new Enpyclopedia (nothing cached) and the titles of the fixtures, prepares whatever
+# it needs outside of the measurements, and returns the list of operations to measure.
+
+def _find(enc: Enpyclopedia, titles: list) -> list:
+    return [ (lambda title=title: enc.find(title)) for title in titles ]
+
+def _get_sections(enc: Enpyclopedia, titles: list) -> list:
+    # @info Category pages have no sections, so they would measure the error path instead
+    pages = [ page for page in enc.find_many(titles).values() if page and page.ns == 0 ]
+    return [ (lambda page=page: get_sections(page, enc.transport)) for page in pages ]
+
+def _get_wiki_text(enc: Enpyclopedia, titles: list) -> list:
+    pages = [ page for page in enc.find_many(titles).values() if page and page.ns == 0 ]
+    sections = [ section for page in pages for section in get_sections(page, enc.transport) or [] ]
+    return [ (lambda section=section: get_wiki_text(section, "wikitext", enc.transport)) for section in sections ]
+
+def _category_members(enc: Enpyclopedia, titles: list) -> list:
+    categories = [ title for title in titles if title.startswith("Category:") ]
+    return [ (lambda category=category: list(iter_category_members(WikipediaEntry(ns=14, title=category), transport=enc.transport))) for category in categories ]
+
+def _get_all_imgs(enc: Enpyclopedia, titles: list) -> list:
+    pages = [ page for page in enc.find_many(titles).values() if page and page.ns == 0 ]
+    directory = tempfile.mkdtemp(prefix="enpyclopedia_bench_")
+    _DIRECTORIES.append(directory)
+    # @info Every operation downloads to its own directory, otherwise images would be skipped as already downloaded
+    return [ (lambda page=page, i=i: get_all_imgs(page, f"{directory}/{i}/", enc.transport)) for i, page in enumerate(pages) ]
+
+def _get_all_imgs_again(enc: Enpyclopedia, titles: list) -> list:
+    pages = [ page for page in enc.find_many(titles).values() if page and page.ns == 0 ]
+    directory = tempfile.mkdtemp(prefix="enpyclopedia_bench_")
+    _DIRECTORIES.append(directory)
+    # @info The images are downloaded before the measurements, so only checking that they are already there is measured
+    for page in pages:
+        download_images(page, directory, transport=enc.transport)
+    return [ (lambda page=page: get_all_imgs(page, directory, enc.transport)) for page in pages ]
+
+SCENARIOS = {
+    "find": _find,
+    "get_sections": _get_sections,
+    "get_wiki_text": _get_wiki_text,
+    "category_members": _category_members,
+    "get_all_imgs": _get_all_imgs,
+    "get_all_imgs_again": _get_all_imgs_again,
+}
+
+def _percentile(values: list, percentile: float) -> float:
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))
+    return values[index]
+
+def _run_operations(operations: list, workers: int) -> list:
+    """
+    Runs the operations (workers of them at a time) and returns the latency of each of them, in seconds.
+    """
+    def timed(operation):
+        start = time.perf_counter()
+        operation()
+        return time.perf_counter() - start
+    if workers <= 1:
+        return [ timed(operation) for operation in operations ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(timed, operations))
+
+def run_scenario(name: str, wiki: MockWiki, titles: list, repeat=3, workers=1) -> dict:
+    """
+    Measures a scenario: repeat timed rounds, followed by one round under tracemalloc to measure memory
+    (kept apart, since tracing slows everything down).
+    @return dict with the results of the scenario.
+    """
+    latencies = []
+    requests = 0
+    transferred = 0
+    elapsed = 0.0
+    operations_run = 0
+    for _ in range(repeat):
+        enc = _new_enpyclopedia(wiki, workers)
+        operations = SCENARIOS[name](enc, titles)
+        before = wiki.stats()
+        start = time.perf_counter()
+        latencies.extend(_run_operations(operations, workers))
+        elapsed += time.perf_counter() - start
+        after = wiki.stats()
+        requests += after["requests"] - before["requests"]
+        transferred += after["bytes"] - before["bytes"]
+        operations_run += len(operations)
+        enc.transport.close()
+
+    enc = _new_enpyclopedia(wiki, workers)
+    operations = SCENARIOS[name](enc, titles)
+    tracemalloc.start()
+    _run_operations(operations, workers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    enc.transport.close()
+
+    return {
+        "operations": operations_run,
+        "operations_per_second": operations_run / elapsed if elapsed else None,
+        "requests": requests,
+        "requests_per_second": requests / elapsed if elapsed else None,
+        "requests_per_operation": requests / operations_run if operations_run else None,
+        "p50_ms": _ms(_percentile(latencies, 50)),
+        "p99_ms": _ms(_percentile(latencies, 99)),
+        "mean_ms": _ms(sum(latencies) / len(latencies)) if latencies else None,
+        "bytes": transferred,
+        "bytes_per_operation": transferred / operations_run if operations_run else None,
+        "peak_memory_bytes": peak,
+    }
+
+def _ms(seconds: float) -> float:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+def _new_enpyclopedia(wiki: MockWiki, workers: int) -> Enpyclopedia:
+    # @info The mock server isn't rate limited, and a limit would be measured instead of the library
+    transport = WikipediaTransport(api_url=wiki.api_url, pool_size=max(10, workers), rate_limiter=RateLimiter(default_rate=None))
+    return Enpyclopedia(transport=transport)
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares results with a baseline run.
+    @return list of the regressions found: metrics that are more than tolerance (a fraction) worse than in the baseline.
+    """
+    higher_is_worse = ("p50_ms", "p99_ms", "requests_per_operation", "bytes_per_operation", "peak_memory_bytes")
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for metric in higher_is_worse:
+            old, new = previous.get(metric), current.get(metric)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append({"scenario": name, "metric": metric, "baseline": old, "current": new, "change": round(new / old - 1, 3)})
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks Enpyclopedia against a local mock MediaWiki server.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated scenarios to run (default: all).")
+    parser.add_argument("--fixtures", help="Fixtures file (see mockwiki.record_fixtures()). Synthetic fixtures are generated by default.")
+    parser.add_argument("--pages", type=int, default=50, help="Amount of pages of the generated fixtures.")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds every response of the server is delayed.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed rounds of every scenario.")
+    parser.add_argument("--workers", type=int, default=1, help="Operations run at the same time.")
+    parser.add_argument("--output", help="File the JSON results are written to (default: standard output).")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with. Exits with status 1 if there are regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Fraction a metric may worsen before it's a regression.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.fixtures:
+        with open(args.fixtures, encoding="utf-8") as f:
+            fixtures = json.load(f)
+    else:
+        fixtures = generate_fixtures(pages=args.pages)
+    wiki = MockWiki(fixtures, latency=args.latency).start()
+    titles = [ page["title"] for page in fixtures["pages"] ]
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"latency": args.latency, "repeat": args.repeat, "workers": args.workers, "pages": len(titles), "fixtures": args.fixtures},
+        "scenarios": {}
+    }
+    try:
+        for name in args.scenarios.split(","):
+            if name not in SCENARIOS:
+                parser.error(f"Unknown scenario '{name}'. Available: {', '.join(SCENARIOS)}")
+            LOGGER.info("Running scenario %s.", name)
+            results["scenarios"][name] = run_scenario(name, wiki, titles, args.repeat, args.workers)
+    finally:
+        wiki.stop()
+        for directory in _DIRECTORIES:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            results["regressions"] = compare(results, json.load(f), args.tolerance)
+        status = 1 if results["regressions"] else 0
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
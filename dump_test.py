@@ -0,0 +1,68 @@
+from enpyclopedia import *
+from enpyclopedia.dump import WikipediaDump, write_multistream_dump
+import logging
+import os
+import shutil
+import tempfile
+
+# Offline check of the dump backend: a small multistream dump is generated, and pages are read back from it.
+# No requests are made, so it can run anywhere.
+
+logging.basicConfig(level=logging.ERROR)
+pages = [
+    { "title": "Potato", "ns": 0, "id": 1, "text": "The '''potato''' is a starchy [[tuber]].\n== History ==\nFirst grown in the Andes.\n=== Europe ===\nIntroduced in the 16th century.\n== Cultivation ==\nGrown in [[soil]].\n[[Category:Root vegetables]]\n[[Category:Crops|Potato]]\n" },
+    { "title": "Tomato", "ns": 0, "id": 2, "text": "The '''tomato''' is a berry.\n[[Category:Crops]]\n" },
+    { "title": "Spud", "ns": 0, "id": 3, "text": "#REDIRECT [[Potato]]", "redirect": "Potato" },
+    { "title": "Category:Crops", "ns": 14, "id": 4, "text": "Plants grown for food.\n" },
+]
+# @info Several streams, so pages have to be found in the right one
+pages += [ { "title": f"Filler {i}", "ns": 0, "id": 100 + i, "text": f"Filler page {i}.\n" } for i in range(20) ]
+
+directory = tempfile.mkdtemp()
+dump_path = os.path.join(directory, "test-pages-articles-multistream.xml.bz2")
+write_multistream_dump(dump_path, os.path.join(directory, "test-pages-articles-multistream-index.txt.bz2"), pages, pages_per_stream=5)
+enc = Enpyclopedia(WikipediaDump(dump_path))
+
+def check(condition: bool, message: str):
+    if not condition:
+        logging.error(message)
+        exit(1)
+
+# find()
+potato = enc.find("Potato")
+check(potato is not None and potato.pageid == 1 and not potato.redirect, "Page 'Potato' was not found.")
+check(enc.find("https://en.wikipedia.org/wiki/Filler_17").pageid == 117, "Page 'Filler 17' was not found by its link.")
+check(enc.find("Turnip") is None, "Page 'Turnip' doesn't exist but it was found.")
+check(enc.find("potato") is not None, "Titles are not normalized.")
+
+# find_many() and redirect resolution
+found = enc.find_many(["Tomato", "Spud", "Turnip", "Filler 3"], redirects=True)
+check(found["Tomato"].pageid == 2 and found["Filler 3"].pageid == 103 and found["Turnip"] is None, f"find_many() found {found}.")
+check(found["Spud"].title == "Potato", f"Redirect 'Spud' was resolved to {found['Spud']}.")
+spud = enc.find("Spud")
+check(spud.redirect, "Page 'Spud' is not marked as a redirect.")
+resolve_redirects([spud], enc.transport)
+check(spud.redirecttarget == "Potato", f"Redirect 'Spud' points to {spud.redirecttarget}.")
+
+# Sections and their wikitext
+sections = get_sections(potato, enc.transport)
+check([ (s.line, s.level, s.number) for s in sections ] == [("History", "2", "1"), ("Europe", "3", "1.1"), ("Cultivation", "2", "2")], f"Wrong sections {sections}.")
+check(get_wiki_text(sections[1], "wikitext", enc.transport).strip() == "=== Europe ===\nIntroduced in the 16th century.", "Wrong wikitext of section 'Europe'.")
+split = split_sections(potato, "wikitext", enc.transport)
+check(split is not None and all(s.wikitext is not None for s in split), "The wikitext of the sections could not be split.")
+check(get_wiki_text(potato, "wikitext", enc.transport).startswith("The '''potato'''"), "Wrong wikitext of page 'Potato'.")
+
+# Categories
+categories = get_categories(potato, enc.transport)
+check(sorted(c.title for c in categories) == ["Category:Crops", "Category:Root vegetables"], f"Wrong categories {categories}.")
+
+# What only the API has is reported as such
+try:
+    get_summary(potato, transport=enc.transport)
+    check(False, "Summaries can't be read from a dump, but no error was raised.")
+except WikipediaAPIError as e:
+    check(e.code == "unsupported", f"Unexpected error {e}.")
+
+enc.transport.close()
+shutil.rmtree(directory)
+print("All dump checks passed.")
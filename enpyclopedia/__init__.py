@@ -7,21 +7,64 @@ The following Encyclopedias may be covered in the future:
 - Wolfram
 """
 import logging
+import hashlib
+import json
 import requests
 from bs4 import BeautifulSoup
-from wget import download
 from tqdm import tqdm # This is a progress bar for when images are being downloaded
+import dataclasses
 from dataclasses import dataclass
 import os
+import re
+import sys
+import time
+import zlib
 import urllib.parse
-from typing import Tuple, Union
+from html import escape
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import Iterable, Sequence, Tuple, Union
+from .transport import WIKI_API_URL, WikipediaAPIError, WikipediaTransport, get_default_transport, set_default_transport
+from .ratelimit import RateLimiter, get_default_rate_limiter, set_default_rate_limiter
+from .metrics import Metrics
+from .cache import ResponseCache, page_revision
+from .store import PageStore, touch_page, touch_section
+from .search import SearchIndex, SearchResult
+from .parse import CONTENT_TAG_RE, HTML_PARSER, HtmlParser, ParsedHtml, extract_html, find_images, find_redirect, html_text, parse_html
 
 LOGGER = logging.getLogger(__name__)
-WIKI_API_URL = "https://en.wikipedia.org/w/api.php"
+WIKI_MAX_TITLES = 50 # Maximum amount of titles the API accepts in a single query (for non-bot users)
+WIKI_MAX_EXTRACTS = 20 # Maximum amount of intro extracts the API returns in a single query
+IMAGE_CHUNK_SIZE = 64 * 1024 # Images are downloaded and written in chunks of this size
+IMAGE_DUPLICATES_FILE = ".duplicates.json" # URLs of the images found to be duplicates, in the directory of every page
 # @info General API Information
 # https://www.mediawiki.org/wiki/API:Info
 
 # @info Classes
+def _slotted(cls):
+    """
+    Recreates a dataclass with __slots__ for its fields, so its objects don't carry a __dict__.
+    Equivalent to @dataclass(slots=True), which needs Python 3.10.
+    """
+    inherited = set()
+    for base in cls.__mro__[1:]:
+        inherited.update(getattr(base, "__slots__", ()))
+    names = [ f.name for f in dataclasses.fields(cls) ]
+    namespace = dict(cls.__dict__)
+    namespace["__slots__"] = tuple(name for name in names if name not in inherited)
+    for name in names:
+        namespace.pop(name, None) # Defaults are already part of the generated __init__
+    namespace.pop("__dict__", None)
+    namespace.pop("__weakref__", None)
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+def _intern(value):
+    """
+    Interns strings, so that the many pages and sections repeating the same value (categories, titles...) share one copy.
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+@_slotted
 @dataclass
 class WikipediaEntry:
     """
@@ -31,6 +74,7 @@ class WikipediaEntry:
     ns: int
     title: str
 
+@_slotted
 @dataclass
 class WikipediaEntryID(WikipediaEntry):
     """
@@ -38,6 +82,7 @@ class WikipediaEntryID(WikipediaEntry):
     """
     pageid: int
 
+@_slotted
 @dataclass
 class WikipediaEntryPage(WikipediaEntryID):
     """
@@ -54,13 +99,36 @@ class WikipediaEntryPage(WikipediaEntryID):
     fullurl: str
     editurl: str
     canonicalurl: str
+    redirect: bool = False
     # @optimization
     # Cached Dynamic Fields (Used to avoid unnecessary requests - requests are expensive!)
     redirects: list = None
     sections: list = None
     categories: list = None
-    html: BeautifulSoup = None
+    rawhtml: bytes = None # zlib-compressed html source of the page, see html
+    summary: str = None
+    languages: list = None
+    redirecttarget: str = None
 
+    # @optimization
+    # A parsed tree uses tens of times more memory than the html it comes from, and it would stay alive
+    # for as long as the page is stored. Only the compressed html is kept, and it's parsed when needed.
+    @property
+    def html(self) -> BeautifulSoup:
+        """
+        Parsed html of the page, or None if it hasn't been retrieved. Every access parses it again.
+        """
+        if self.rawhtml is None:
+            return None
+        return parse_html(zlib.decompress(self.rawhtml))
+
+    @html.setter
+    def html(self, value: Union[BeautifulSoup, str, bytes]):
+        if value is not None and not isinstance(value, bytes):
+            value = str(value).encode()
+        self.rawhtml = zlib.compress(value) if value is not None else None
+
+@_slotted
 @dataclass
 class WikipediaSection:
     toclevel: str
@@ -71,34 +139,200 @@ class WikipediaSection:
     fromtitle: str
     byteoffset: str
     anchor: str
+    # @optimization
+    # Cached Dynamic Fields, filled by split_sections()
+    text: str = None
+    wikitext: str = None
+
+@_slotted
+@dataclass
+class ImageDownload:
+    """
+    Result of downloading an image with download_images().
+    The status is one of "downloaded", "resumed" (a partial download was completed), "skipped" (it was already downloaded),
+    "duplicate" (the same image was found at another URL, path is the one of the first copy) or "failed".
+    """
+    url: str
+    path: str
+    status: str
+    size: int = 0
+    sha256: str = None
+    error: str = None
+
+# @info Helpers
+
+def _title_from_link(to_find: str) -> str:
+    """
+    Returns the title of the page a link points to, or the string itself if it isn't a link.
+    """
+    title = to_find
+    # @info Basic Link checking, the more robust option would involve regex but
+    # for our purposes I think that would be overkill.
+    if "https://" in to_find or "http://" in to_find:
+        # We want the title of the page if we know the link.
+        # This is essentially the last part of the url string
+        title = to_find.split('/')
+        title = urllib.parse.unquote(title[len(title) - 1])
+    return title
+
+def _page_from_info(pg: dict) -> WikipediaEntryPage:
+    """
+    Creates a WikipediaEntryPage from a page returned by a query with prop=info|redirects and inprop=url|talkid.
+    """
+    page = WikipediaEntryPage(ns=pg["ns"], title=pg["title"], pageid=int(pg["pageid"]), contentmodel=_intern(pg["contentmodel"]), pagelanguage=_intern(pg["pagelanguage"]), pagelanguagehtmlcode=_intern(pg["pagelanguagehtmlcode"]), pagelanguagedir=_intern(pg["pagelanguagedir"]), touched=pg["touched"], lastrevid=int(pg["lastrevid"]), length=int(pg["length"]), talkid=int(pg.get("talkid", 0)), fullurl=pg["fullurl"], editurl=pg["editurl"], canonicalurl=pg["canonicalurl"], redirect="redirect" in pg)
+    if "redirects" in pg.keys():
+        page.redirects = [ WikipediaEntryID(ns=int(redir["ns"]), title=redir["title"], pageid=int(redir["pageid"])) for redir in pg["redirects"] ]
+    return page
+
+def _update_info(wiki_page: WikipediaEntryPage, info: WikipediaEntryPage):
+    """
+    Copies the information fields (touched, lastrevid, length...) of info, as returned by _page_from_info(),
+    into wiki_page, leaving its cached fields as they are.
+    """
+    for field in ("ns", "title", "contentmodel", "pagelanguage", "pagelanguagehtmlcode", "pagelanguagedir", "touched", "lastrevid", "length", "talkid", "fullurl", "editurl", "canonicalurl", "redirect"):
+        setattr(wiki_page, field, getattr(info, field))
+
+def _language_link(langlink: dict) -> str:
+    """
+    Link to the page a langlink (as returned by prop=langlinks) refers to.
+    """
+    code = langlink["lang"]
+    new_title = urllib.parse.quote(langlink["*"])
+    return f"https://{code}.wikipedia.org/wiki/{new_title}"
+
+def _query_continued(query_params: dict, transport: WikipediaTransport):
+    """
+    Performs a query and keeps following its 'continue' token until the results are complete.
+    @return Generator of the JSON responses, one per request.
+    """
+    # https://www.mediawiki.org/wiki/API:Continue
+    continuation = {}
+    while True:
+        res = transport.query({**query_params, **continuation})
+        yield res
+        if "continue" not in res:
+            break
+        continuation = res["continue"]
+
+def _merge_query_pages(pages: dict, new_pages: dict):
+    """
+    Merges the pages of a continued query response into the ones previously received.
+    List properties (such as redirects or categories) are split among responses, so they are concatenated.
+    Responses may be shared with other threads (see WikipediaTransport), so their pages and lists are copied
+    instead of being modified.
+    """
+    for k, pg in new_pages.items():
+        if k not in pages:
+            pages[k] = { prop: list(value) if isinstance(value, list) else value for prop, value in pg.items() }
+            continue
+        for prop, value in pg.items():
+            if isinstance(value, list):
+                pages[k].setdefault(prop, []).extend(value)
+            else:
+                pages[k].setdefault(prop, value)
 
 # Functions
 
-def get_html(url: str):
-    req = requests.get(url)
-    LOGGER.info("Request URL: %s", req.url)
-    return BeautifulSoup(req.content, 'html.parser')
+def get_html(url: str, transport: WikipediaTransport = None, revision: str = None):
+    """
+    Retrieves and parses the html source of any url.
+    @arg revision: If the url is the one of a page, its revision (see page_revision()) allows the response to be cached.
+    """
+    if transport is None:
+        transport = get_default_transport()
+    return _parse_html(transport.fetch(url, revision=revision), transport)
 
-def is_redirecting(wiki_page: WikipediaEntryPage) -> str:
+def _parse_html(raw: bytes, transport: WikipediaTransport, extract=parse_html, *args):
+    """
+    Parses html with extract (parse_html() by default, or one of the extraction functions of parse.py),
+    recording how long it took in the metrics of the transport.
+    """
+    start = time.perf_counter()
+    html = extract(raw, *args)
+    metrics = getattr(transport, "metrics", None)
+    if metrics is not None:
+        metrics.observe_parse(time.perf_counter() - start, len(raw))
+    return html
+
+def _page_raw(wiki_page: WikipediaEntryPage, transport: WikipediaTransport) -> bytes:
+    """
+    Html source of a page, retrieving it first (and keeping it compressed in the page) if needed.
+    The parsed tree is never stored, so callers only build what they need from it and release it as soon as they are done.
+    """
+    if transport is None:
+        transport = get_default_transport()
+    if wiki_page.rawhtml is not None:
+        return zlib.decompress(wiki_page.rawhtml)
+    raw = transport.fetch(wiki_page.fullurl, revision=page_revision(wiki_page))
+    wiki_page.html = raw
+    touch_page(wiki_page)
+    return raw
+
+def extract_page(wiki_page: WikipediaEntryPage, parser: HtmlParser = None, transport: WikipediaTransport = None) -> ParsedHtml:
+    """
+    Retrieves the html of a page (see WikipediaEntryPage.html) and extracts its plain text, images, links and
+    redirect marker, without keeping the parsed tree.
+    @arg parser: HtmlParser whose pool of processes does the parsing. By default, it's done in the calling thread.
+    @return ParsedHtml with what was found.
+    """
+    if transport is None:
+        transport = get_default_transport()
+    raw = _page_raw(wiki_page, transport)
+    if parser is None:
+        return _parse_html(raw, transport, extract_html, wiki_page.fullurl)
+    return _parse_html(raw, transport, parser.extract, wiki_page.fullurl)
+
+def is_redirecting(wiki_page: WikipediaEntryPage, transport: WikipediaTransport = None, use_html=False) -> str:
     """
     Checks wether or not the WikipediaEntryPage is redirecting to another page.
     A page that is redirecting to another one will not inherit certain fields on a request like Sections.
+    Pages found with find() already know if they are redirects, so no request is made for pages that aren't,
+    and the target of those that are is resolved through the API (see resolve_redirects()) and stored in the page.
+    @arg use_html: If True, the check is made by downloading and parsing the html of the page instead, as it was done previously.
     @return String containing the title of the page it redirects to, or None if it isn't a redirection
     """
 
-    if not wiki_page.html:
-        wiki_page.html = get_html(wiki_page.fullurl)
+    if use_html:
+        # @optimization Only the heading and the "Redirected from" notice are parsed
+        return _parse_html(_page_raw(wiki_page, transport), transport, find_redirect)
 
-    redirecting = wiki_page.html.find('span', {"class": "mw-redirectedfrom"})
-    if redirecting:
-        return wiki_page.html.find('h1', {"id": "firstHeading", "class": "firstHeading"}).text
-    return None
+    if wiki_page.redirecttarget is None and wiki_page.redirect:
+        resolve_redirects([wiki_page], transport)
+    return wiki_page.redirecttarget
+
+def resolve_redirects(wiki_pages: Sequence[WikipediaEntryPage], transport: WikipediaTransport = None) -> dict:
+    """
+    Resolves the target of every page that is a redirect, and stores it in its redirecttarget field.
+    Only the API metadata is requested (redirects=1), in batches of WIKI_MAX_TITLES pages.
+    @return dict that maps the title of each redirect to the title of the page it redirects to.
+    """
+    if transport is None:
+        transport = get_default_transport()
+    redirecting = [ page for page in wiki_pages if page.redirect ]
+    targets = {}
+    for i in range(0, len(redirecting), WIKI_MAX_TITLES):
+        batch = redirecting[i:i + WIKI_MAX_TITLES]
+        query_params = {
+            "action": "query",
+            "format": "json",
+            "pageids": "|".join(str(page.pageid) for page in batch),
+            "redirects": 1
+        }
+        res = transport.query(query_params, ",".join(page_revision(page) for page in batch))
+        targets.update({ r["from"]: r["to"] for r in res["query"].get("redirects", []) })
+        for page in batch:
+            page.redirecttarget = targets.get(page.title)
+            touch_page(page)
+    return targets
 
-def get_summary(wiki_page: WikipediaEntryPage) -> str:
+def get_summary(wiki_page: WikipediaEntryPage, transport: WikipediaTransport = None) -> str:
     """
     Retrieves the first section of text of a specific wikipedia page, which acts like a summary of the page.
+    If the summary was already previously found (for example by hydrate()), it returns the previous one.
     @return String containing the summary of the page (text from the first section).
     """
+    if wiki_page.summary is not None:
+        return wiki_page.summary
     summary = ""
     query_params = {
             "action": "query",
@@ -110,16 +344,19 @@ def get_summary(wiki_page: WikipediaEntryPage) -> str:
         }
     # @info Creating REST Query String without "None"
     params_str = '&'.join([k if v is None else f"{k}={v}" for k, v in query_params.items()])
-    req = requests.Session().get(url=WIKI_API_URL, params=params_str)
-    LOGGER.info("Request URL: %s", req.url)
-    for k, pg in req.json()["query"]["pages"].items():
+    if transport is None:
+        transport = get_default_transport()
+    for k, pg in transport.query(params_str, page_revision(wiki_page))["query"]["pages"].items():
         if k != "-1":
             summary = pg["extract"].strip()
+            wiki_page.summary = summary
+            touch_page(wiki_page)
     return summary
 
-def get_wiki_text(wiki_data: Union[WikipediaEntryPage, WikipediaSection], type_text="text") -> str:
+def get_wiki_text(wiki_data: Union[WikipediaEntryPage, WikipediaSection], type_text="text", transport: WikipediaTransport = None) -> str:
     """
     Retrieves the full text of the WikipediaPage
+    The text of a section is stored in it, so if it was already previously found (also by split_sections()), it returns the previous one.
     @arg type_text: There are two possible types of queries. The default option is "text" and retrieves the html code, while the "wikitext" option retrieves it in a wiki format.
     @return String
     """
@@ -127,8 +364,10 @@ def get_wiki_text(wiki_data: Union[WikipediaEntryPage, WikipediaSection], type_t
         LOGGER.error("get_wiki_text() called with an argument that was neither a WikipediaEntryPage nor a WikipediaSection.")
         return None # If it's neither a page nor a section, abort
     if type_text != "text" and type_text != "wikitext":
-        LOGGER.error("get_wiki_text() called with argument type_text = '%s' but can only be 'text' or 'wikitext'.", type)
+        LOGGER.error("get_wiki_text() called with argument type_text = '%s' but can only be 'text' or 'wikitext'.", type_text)
         return None
+    if isinstance(wiki_data, WikipediaSection) and getattr(wiki_data, type_text) is not None:
+        return getattr(wiki_data, type_text)
     query_params = {
             "action": "parse",
             "format": "json",
@@ -136,21 +375,126 @@ def get_wiki_text(wiki_data: Union[WikipediaEntryPage, WikipediaSection], type_t
         }
     
     # https://www.mediawiki.org/w/api.php?action=parse&page=API:Parsing_wikitext&section=1&prop=text
+    revision = None
     if isinstance(wiki_data, WikipediaSection):
         query_params["section"] = wiki_data.index
         query_params["page"] = wiki_data.fromtitle
     else:
         query_params["page"] = wiki_data.title
+        revision = page_revision(wiki_data)
 
-    req = requests.Session().get(url=WIKI_API_URL, params=query_params)
-    LOGGER.info("Request URL: %s", req.url)
-    return req.json()["parse"][type_text]["*"]
+    if transport is None:
+        transport = get_default_transport()
+    text = transport.query(query_params, revision)["parse"][type_text]["*"]
+    if isinstance(wiki_data, WikipediaSection):
+        setattr(wiki_data, type_text, text)
+        touch_section(wiki_data)
+    return text
+
+def _section_from_parse(s: dict) -> WikipediaSection:
+    """
+    Creates a WikipediaSection from a section returned by action=parse with prop=sections.
+    """
+    return WikipediaSection(toclevel=_intern(s["toclevel"]), level=_intern(s["level"]), line=s["line"], number=_intern(s["number"]), index=_intern(s["index"]), fromtitle=_intern(s["fromtitle"]), anchor=s["anchor"], byteoffset=s["byteoffset"])
+
+def _section_bounds(sections: list, offsets: list, length: int) -> list:
+    """
+    Computes where each section starts and ends, given where each of them starts (or None if unknown).
+    Just like in MediaWiki, a section includes its subsections: it ends where the next section of the same or higher level starts.
+    @return list with a (start, end) tuple for each section, or None for the sections with an unknown start.
+    """
+    bounds = []
+    for i, (section, start) in enumerate(zip(sections, offsets)):
+        if start is None:
+            bounds.append(None)
+            continue
+        end = length
+        for other, other_start in zip(sections[i + 1:], offsets[i + 1:]):
+            if other_start is not None and int(other.level) <= int(section.level):
+                end = other_start
+                break
+        bounds.append((start, end))
+    return bounds
+
+def _split_wikitext(sections: list, wikitext: str):
+    """
+    Stores the wikitext of each section in it, using the byte offsets returned by the API.
+    Sections coming from templates have no byte offset in the page, so they are left as they are.
+    """
+    raw = wikitext.encode("utf-8")
+    offsets = [ s.byteoffset if isinstance(s.byteoffset, int) and not str(s.index).startswith("T") else None for s in sections ]
+    for section, bounds in zip(sections, _section_bounds(sections, offsets, len(raw))):
+        if bounds is not None:
+            # @info MediaWiki trims the trailing whitespace of every section it extracts
+            section.wikitext = raw[bounds[0]:bounds[1]].decode("utf-8").rstrip(" \t\n\r\0\x0b")
+
+def _split_html(sections: list, html: str):
+    """
+    Stores the html of each section in it, splitting the html of the whole page at the heading of each section,
+    which is found through its anchor. The result is wrapped like the html of a section returned by the API.
+    """
+    start = CONTENT_TAG_RE.search(html)
+    content_start = start.end() if start is not None else 0
+    content_end = html.rfind("</div>") if start is not None else len(html)
+    offsets = []
+    for section in sections:
+        anchor = html.find(f' id="{escape(section.anchor)}"', content_start, content_end)
+        if anchor == -1:
+            offsets.append(None)
+            continue
+        # @info The heading starts either at its wrapper (current markup) or at the heading tag itself (legacy markup)
+        heading = html.rfind(f"<h{section.level}", content_start, anchor)
+        if heading == -1:
+            heading = anchor
+        wrapper = html.rfind('<div class="mw-heading', content_start, heading)
+        if wrapper != -1 and re.fullmatch(r'<div class="mw-heading[^>]*>\s*', html[wrapper:heading]):
+            heading = wrapper
+        offsets.append(heading)
+    for section, bounds in zip(sections, _section_bounds(sections, offsets, content_end)):
+        if bounds is not None:
+            section.text = f'<div class="mw-parser-output">{html[bounds[0]:bounds[1]].strip()}</div>'
+
+def split_sections(wiki_page: WikipediaEntryPage, type_text="wikitext", transport: WikipediaTransport = None) -> list:
+    """
+    Retrieves the text of the whole page with a single request, and splits it locally into its sections,
+    using the data returned by get_sections(). The text of each section is stored in it, so that
+    get_wiki_text() can return it without making one request per section.
+    If the page's sections hadn't been retrieved yet, they are retrieved in the same request.
+    @arg type_text: Either "wikitext" (the default), which is split exactly as the API would, or "text" (html), which is split
+    at the headings of the page and thus doesn't include the parser report that the API adds to each section.
+    @return a list of WikipediaSection containing all the sections and their text, or None if any argument is wrong.
+    """
+    if type_text != "text" and type_text != "wikitext":
+        LOGGER.error("split_sections() called with argument type_text = '%s' but can only be 'text' or 'wikitext'.", type_text)
+        return None
+    if wiki_page.sections and all(getattr(s, type_text) is not None for s in wiki_page.sections if s.byteoffset is not None):
+        return wiki_page.sections
+    if transport is None:
+        transport = get_default_transport()
+    query_params = {
+            "action": "parse",
+            "format": "json",
+            "page": wiki_page.title,
+            "prop": f"sections|{type_text}"
+        }
+    parsed = transport.query(query_params, page_revision(wiki_page))["parse"]
+    sections = wiki_page.sections or [ _section_from_parse(s) for s in parsed["sections"] ]
+    if type_text == "wikitext":
+        _split_wikitext(sections, parsed["wikitext"]["*"])
+    else:
+        _split_html(sections, parsed["text"]["*"])
+    wiki_page.sections = sections
+    touch_page(wiki_page)
+    return sections
 
-def get_other_languages(wiki_page: WikipediaEntryPage) -> list:
+def get_other_languages(wiki_page: WikipediaEntryPage, transport: WikipediaTransport = None) -> list:
     """
     Returns the links for the current page in all other available languages.
+    If the links were already previously found (for example by hydrate()), it returns the previous ones.
     @return List of strings
     """
+    if wiki_page.languages is not None:
+        return wiki_page.languages
     query_params = {
             "action": "query",
             "format": "json",
@@ -158,21 +502,22 @@ def get_other_languages(wiki_page: WikipediaEntryPage) -> list:
             "prop": "langlinks"
         }
 
-    req = requests.Session().get(url=WIKI_API_URL, params=query_params)
-    LOGGER.info("Request URL: %s", req.url)
+    if transport is None:
+        transport = get_default_transport()
     final_links = []
-    for k, pg in req.json()["query"]["pages"].items():
+    for k, pg in transport.query(query_params, page_revision(wiki_page))["query"]["pages"].items():
         if k != "-1":
-            links = pg["langlinks"]
+            links = pg.get("langlinks", [])
             for l in links:
-                code = l["lang"]
-                new_title = urllib.parse.quote(l["*"])
-                final_links.append(f"https://{code}.wikipedia.org/wiki/{new_title}")
+                final_links.append(_language_link(l))
+            wiki_page.languages = final_links
+            touch_page(wiki_page)
     return final_links
 
-def get_sections(wiki_page: WikipediaEntryPage) -> list:
+def get_sections(wiki_page: WikipediaEntryPage, transport: WikipediaTransport = None, use_html=False) -> list:
     """
     Retrieves all the sections of the current page. If the sections were already previously found, it returns the previous ones.
+    @arg use_html: Passed to is_redirecting(), which is used to explain why a page may have no sections.
     @return a list of WikipediaSection containing all the sections. 
     """
     # https://www.mediawiki.org/w/api.php?action=parse&page=API:Parsing_wikitext&prop=sections
@@ -180,8 +525,10 @@ def get_sections(wiki_page: WikipediaEntryPage) -> list:
         LOGGER.warning("This WikipediaEntryPage has already retrieved all of its sections at a previous time. Returning previously found sections to avoid unnecessary requests. ")
         return wiki_page.sections
     
+    if transport is None:
+        transport = get_default_transport()
     # @info This check provides useful information to the user that otherwise may take a while to figure out
-    redirecting_check = is_redirecting(wiki_page)
+    redirecting_check = is_redirecting(wiki_page, transport, use_html)
     if redirecting_check:
         LOGGER.warning("This WikipediaEntryPage (%s) is redirecting to another page (%s). It's likely that sections do not appear.", wiki_page.title, redirecting_check)
 
@@ -192,26 +539,24 @@ def get_sections(wiki_page: WikipediaEntryPage) -> list:
             "prop": "sections"
         }
 
-    req = requests.Session().get(url=WIKI_API_URL, params=query_params)
-    LOGGER.info("Request URL: %s", req.url)
-    sects = req.json()["parse"]["sections"]
-    wiki_page.sections = []
-    
-    for s in sects:
-        wiki_page.sections.append(WikipediaSection(toclevel=s["toclevel"], level=s["level"], line=s["line"], number=s["number"], index=s["index"], fromtitle=s["fromtitle"], anchor=s["anchor"], byteoffset=s["byteoffset"]))
+    sects = transport.query(query_params, page_revision(wiki_page))["parse"]["sections"]
+    # @info The list is filled before it's stored, so other threads never see it half-filled
+    sections = [ _section_from_parse(s) for s in sects ]
+    wiki_page.sections = sections
+    touch_page(wiki_page)
     
     # Error checking
-    if not wiki_page.sections:
+    if not sections:
         LOGGER.warning("No sections found for page '%s'. Checking if page is redirecting...", wiki_page.title)
-        redirecting_check = is_redirecting(wiki_page)
+        redirecting_check = is_redirecting(wiki_page, transport, use_html)
         if redirecting_check:
             LOGGER.warning("This WikipediaEntryPage '%s' is redirecting to another page (%s). The MediaWiki API does not return the sections for redirecting pages.", wiki_page.title, redirecting_check)
         else:
-            LOGGER.error("No sections found and page '%s' was not redirecting to another one. You should manually check the request url '%s' to see what's wrong.", wiki_page.title, req.url)
+            LOGGER.error("No sections found and page '%s' was not redirecting to another one. You should manually check the request parameters '%s' to see what's wrong.", wiki_page.title, query_params)
             return None
-    return wiki_page.sections
+    return sections
 
-def get_categories(wiki_page: WikipediaEntryPage) -> list:
+def get_categories(wiki_page: WikipediaEntryPage, transport: WikipediaTransport = None) -> list:
     """
     Retrieves all the categories of the current page. If the categories were already previously found, it returns the previous ones.
     @return a list of WikipediaEntryPage containing all the sections. 
@@ -227,24 +572,22 @@ def get_categories(wiki_page: WikipediaEntryPage) -> list:
             "prop": "categories"
         }
 
-    req = requests.Session().get(url=WIKI_API_URL, params=query_params)
-    LOGGER.info("Request URL: %s", req.url)
-    wiki_page.categories = []
-    for k, p in req.json()["query"]["pages"].items():
+    if transport is None:
+        transport = get_default_transport()
+    categories = []
+    for k, p in transport.query(query_params, page_revision(wiki_page))["query"]["pages"].items():
         if k != "-1":
-            for s in p["categories"]:
-                wiki_page.categories.append(WikipediaEntry(ns=int(s["ns"]), title=s["title"]))
-    return wiki_page.categories
+            for s in p.get("categories", []):
+                categories.append(WikipediaEntry(ns=int(s["ns"]), title=_intern(s["title"])))
+    wiki_page.categories = categories
+    touch_page(wiki_page)
+    return categories
 
-def get_category_members(wiki_category: WikipediaEntry, cmlimit = 20, cmprop = "", cmsort = "", cmdir = "", cmtype="", cmstarthexsortkey="", cmendhexsortkey="", cmstartsortkeyprefix="", cmendsortkeyprefix="", cmnamespace="") -> list:
+def _category_members_params(wiki_category: WikipediaEntry, cmlimit, cmprop, cmsort, cmdir, cmtype, cmstarthexsortkey, cmendhexsortkey, cmstartsortkeyprefix, cmendsortkeyprefix, cmnamespace) -> dict:
     """
-    It retrieves a certain amount (limited by cmlimit) of pages that belong to a specific category.
-    This WikipediaEntryPage object must be a valid Category for the method to work. 
-    Full list of arguments can be found in the following link:
-    https://www.mediawiki.org/wiki/API:Categorymembers
-    @return None if the current WikipediaEntryPage object is not a Category, or a list of WikipediaEntryPage objects of cmlimit length.
+    Builds the query parameters shared by get_category_members() and iter_category_members().
+    @return None if wiki_category is not a Category.
     """
-    
     # https://www.mediawiki.org/wiki/API:Categorymembers
     # Check if this is a category (by finding the Category prefix)
     if wiki_category.title.split(":")[0] != "Category":
@@ -275,18 +618,43 @@ def get_category_members(wiki_category: WikipediaEntry, cmlimit = 20, cmprop = "
         query_params["cmdir"] = cmdir
     if cmtype != "":
         query_params["cmtype"] = cmtype
+    if cmnamespace != "":
+        query_params["cmnamespace"] = cmnamespace
+    return query_params
 
-    req = requests.Session().get(url=WIKI_API_URL, params=query_params)
-    LOGGER.info("Request URL: %s", req.url)
-    categorymembers = [ WikipediaEntryID(ns=int(p["ns"]), title=p["title"], pageid=int(p["pageid"])) for p in req.json()["query"]["categorymembers"] ]
+def get_category_members(wiki_category: WikipediaEntry, cmlimit = 20, cmprop = "", cmsort = "", cmdir = "", cmtype="", cmstarthexsortkey="", cmendhexsortkey="", cmstartsortkeyprefix="", cmendsortkeyprefix="", cmnamespace="", transport: WikipediaTransport = None) -> list:
+    """
+    It retrieves a certain amount (limited by cmlimit) of pages that belong to a specific category.
+    This WikipediaEntryPage object must be a valid Category for the method to work. 
+    Full list of arguments can be found in the following link:
+    https://www.mediawiki.org/wiki/API:Categorymembers
+    Use iter_category_members() to retrieve all of them instead.
+    @return None if the current WikipediaEntryPage object is not a Category, or a list of WikipediaEntryPage objects of cmlimit length.
+    """
+    query_params = _category_members_params(wiki_category, cmlimit, cmprop, cmsort, cmdir, cmtype, cmstarthexsortkey, cmendhexsortkey, cmstartsortkeyprefix, cmendsortkeyprefix, cmnamespace)
+    if query_params is None:
+        return None
+    if transport is None:
+        transport = get_default_transport()
+    categorymembers = [ WikipediaEntryID(ns=int(p["ns"]), title=p["title"], pageid=int(p["pageid"])) for p in transport.query(query_params)["query"]["categorymembers"] ]
     return categorymembers
 
-def get_all_pages(wiki_page: WikipediaEntryPage, aplimit=10, apdir="", apcontinue="", apto="", apprefix="", apnamespace="", apfilterredir="", apminsize="", apmaxsize="", apprtype="", apprlevel="", apprfiltercascade="", apfilterlanglinks="", apprexpiry="") -> list:
+def iter_category_members(wiki_category: WikipediaEntry, cmprop = "", cmsort = "", cmdir = "", cmtype="", cmstarthexsortkey="", cmendhexsortkey="", cmstartsortkeyprefix="", cmendsortkeyprefix="", cmnamespace="", prefetch=False, resume: dict = None, transport: WikipediaTransport = None) -> "QueryStream":
     """
-    It retrieves a certain amount (limited by aplimit) of pages that can be found in the current page.
-    Full list of arguments can be found in the following link:
-    https://www.mediawiki.org/wiki/API:Allpages
-    @return a list of WikipediaEntryPage objects of cmlimit length.
+    Streaming version of get_category_members() that yields every page in the category, however many there are.
+    Takes the same arguments (except cmlimit, since the maximum allowed by the server is always used).
+    @arg prefetch: If True, the next batch of results is requested in the background while the current one is consumed.
+    @arg resume: resume_token of a previous QueryStream, to restart an interrupted enumeration where it stopped.
+    @return None if wiki_category is not a Category, or a QueryStream of WikipediaEntryID objects.
+    """
+    query_params = _category_members_params(wiki_category, "max", cmprop, cmsort, cmdir, cmtype, cmstarthexsortkey, cmendhexsortkey, cmstartsortkeyprefix, cmendsortkeyprefix, cmnamespace)
+    if query_params is None:
+        return None
+    return QueryStream(query_params, "categorymembers", transport, resume, prefetch)
+
+def _all_pages_params(wiki_page: WikipediaEntryPage, aplimit, apdir, apcontinue, apto, apprefix, apnamespace, apfilterredir, apminsize, apmaxsize, apprtype, apprlevel, apprfiltercascade, apfilterlanglinks, apprexpiry) -> dict:
+    """
+    Builds the query parameters shared by get_all_pages() and iter_all_pages().
     """
     query_params = {
             "action": "query",
@@ -305,7 +673,7 @@ def get_all_pages(wiki_page: WikipediaEntryPage, aplimit=10, apdir="", apcontinu
     if apprefix != "":
         query_params["apprefix"] = apprefix
     if apnamespace != "":
-        query_params["apnamespace"] = apdir
+        query_params["apnamespace"] = apnamespace
     if apfilterredir != "":
         query_params["apfilterredir"] = apfilterredir
     if apminsize != "":
@@ -322,83 +690,473 @@ def get_all_pages(wiki_page: WikipediaEntryPage, aplimit=10, apdir="", apcontinu
         query_params["apfilterlanglinks"] = apfilterlanglinks
     if apprexpiry != "":
         query_params["apprexpiry"] = apprexpiry
+    return query_params
 
-    req = requests.Session().get(url=WIKI_API_URL, params=query_params)
-    LOGGER.info("Request URL: %s", req.url)
-    allpages = [  WikipediaEntryID(ns=int(p["ns"]), title=p["title"], pageid=int(p["pageid"])) for p in req.json()["query"]["allpages"] ]
+def get_all_pages(wiki_page: WikipediaEntryPage, aplimit=10, apdir="", apcontinue="", apto="", apprefix="", apnamespace="", apfilterredir="", apminsize="", apmaxsize="", apprtype="", apprlevel="", apprfiltercascade="", apfilterlanglinks="", apprexpiry="", transport: WikipediaTransport = None) -> list:
+    """
+    It retrieves a certain amount (limited by aplimit) of pages that can be found in the current page.
+    Full list of arguments can be found in the following link:
+    https://www.mediawiki.org/wiki/API:Allpages
+    Use iter_all_pages() to retrieve all of them instead.
+    @return a list of WikipediaEntryPage objects of cmlimit length.
+    """
+    query_params = _all_pages_params(wiki_page, aplimit, apdir, apcontinue, apto, apprefix, apnamespace, apfilterredir, apminsize, apmaxsize, apprtype, apprlevel, apprfiltercascade, apfilterlanglinks, apprexpiry)
+    if transport is None:
+        transport = get_default_transport()
+    allpages = [  WikipediaEntryID(ns=int(p["ns"]), title=p["title"], pageid=int(p["pageid"])) for p in transport.query(query_params)["query"]["allpages"] ]
     return allpages
-    
-def get_all_imgs(wiki_page: WikipediaEntryPage, base_directory="imgs\\") -> Tuple[int, int]:
+
+def iter_all_pages(wiki_page: WikipediaEntryPage, apdir="", apto="", apprefix="", apnamespace="", apfilterredir="", apminsize="", apmaxsize="", apprtype="", apprlevel="", apprfiltercascade="", apfilterlanglinks="", apprexpiry="", prefetch=False, resume: dict = None, transport: WikipediaTransport = None) -> "QueryStream":
     """
-    Downloads using wget's package all images found in a webpage to the specified directory.
-    @returns integer tuple that contains the amount of images downloaded and the total amount of images encountered. 
-    Note that behaviour is non-blocking, meaning that encountering an error will not stop the method from attempting to download the rest of images found.
+    Streaming version of get_all_pages() that yields every page from wiki_page onwards (or up to apto).
+    Takes the same arguments (except aplimit, since the maximum allowed by the server is always used, and apcontinue,
+    which is replaced by resume).
+    @arg prefetch: If True, the next batch of results is requested in the background while the current one is consumed.
+    @arg resume: resume_token of a previous QueryStream, to restart an interrupted enumeration where it stopped.
+    @return a QueryStream of WikipediaEntryID objects.
     """
-    
-    imgs_downloaded = 0
+    query_params = _all_pages_params(wiki_page, "max", apdir, "", apto, apprefix, apnamespace, apfilterredir, apminsize, apmaxsize, apprtype, apprlevel, apprfiltercascade, apfilterlanglinks, apprexpiry)
+    return QueryStream(query_params, "allpages", transport, resume, prefetch)
+
+class QueryStream:
+    """
+    Iterator over all the results of a list query (such as categorymembers or allpages).
+    Results are requested lazily, one batch at a time, following the API's 'continue' token,
+    so enumerating a list of any size only keeps a single batch in memory (two if prefetching).
+    """
+
+    def __init__(self, query_params: dict, list_name: str, transport: WikipediaTransport = None, resume: dict = None, prefetch=False):
+        """
+        @arg list_name: Name of the list in the query response, such as "categorymembers".
+        @arg resume: Continuation token to start from, as found in resume_token.
+        @arg prefetch: If True, the next batch is requested in the background while the current one is consumed.
+        """
+        self.query_params = query_params
+        self.list_name = list_name
+        self.transport = transport if transport is not None else get_default_transport()
+        self.prefetch = prefetch
+        # @info Token of the batch currently being consumed. Restarting from it may repeat a few results
+        # of that batch, but never skips any. It becomes None once all results have been consumed.
+        self.resume_token = resume if resume is not None else {}
+
+    def _fetch(self, continuation: dict) -> dict:
+        return self.transport.query({**self.query_params, **continuation})
+
+    def __iter__(self):
+        if self.resume_token is None:
+            return
+        executor = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+        try:
+            continuation = self.resume_token
+            res = self._fetch(continuation)
+            while True:
+                self.resume_token = continuation
+                next_continuation = res.get("continue")
+                next_res = None
+                if next_continuation is not None and executor is not None:
+                    next_res = executor.submit(self._fetch, next_continuation)
+                for p in res["query"][self.list_name]:
+                    yield WikipediaEntryID(ns=int(p["ns"]), title=p["title"], pageid=int(p["pageid"]))
+                if next_continuation is None:
+                    self.resume_token = None
+                    break
+                continuation = next_continuation
+                res = next_res.result() if next_res is not None else self._fetch(continuation)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+def hydrate(wiki_pages: Sequence[WikipediaEntryPage], props=("extracts", "categories", "langlinks"), transport: WikipediaTransport = None) -> Sequence[WikipediaEntryPage]:
+    """
+    Retrieves several properties of many pages at once, and stores them in each WikipediaEntryPage.
+    Instead of one request per page and property (get_summary(), get_categories(), get_other_languages()...),
+    it makes one request per batch of WIKI_MAX_TITLES pages (WIKI_MAX_EXTRACTS if summaries are requested),
+    plus the continuations needed for the results to be complete.
+    @arg props: Any of the following:
+        - "info": Updates the page information fields (touched, lastrevid, length...).
+        - "redirects": Stores the pages redirecting to each page in the redirects field.
+        - "extracts": Stores the summary (as returned by get_summary()) in the summary field.
+        - "categories": Stores the categories (as returned by get_categories()) in the categories field.
+        - "langlinks": Stores the links to other languages (as returned by get_other_languages()) in the languages field.
+    @return The same pages, hydrated.
+    """
+    # https://www.mediawiki.org/wiki/API:Query#Specifying_pages
+    if transport is None:
+        transport = get_default_transport()
+    props = list(props)
+    batch_size = WIKI_MAX_EXTRACTS if "extracts" in props else WIKI_MAX_TITLES
+    for i in range(0, len(wiki_pages), batch_size):
+        batch = { page.pageid: page for page in wiki_pages[i:i + batch_size] }
+        query_params = {
+            "action": "query",
+            "format": "json",
+            "pageids": "|".join(str(pageid) for pageid in batch),
+            "prop": "|".join(props)
+        }
+        if "info" in props:
+            query_params["inprop"] = "url|talkid"
+        if "redirects" in props:
+            query_params["rdlimit"] = "max"
+        if "extracts" in props:
+            query_params.update({"exintro": 1, "explaintext": 1, "exlimit": "max"})
+        if "categories" in props:
+            query_params["cllimit"] = "max"
+        if "langlinks" in props:
+            query_params["lllimit"] = "max"
+        revision = ",".join(page_revision(page) for page in batch.values())
+        pages = {}
+        continuation = {}
+        # @info Same as _query_continued(), but the first response is cached along with the revisions of the batch
+        while True:
+            res = transport.query({**query_params, **continuation}, None if continuation else revision)
+            _merge_query_pages(pages, res["query"].get("pages", {}))
+            if "continue" not in res:
+                break
+            continuation = res["continue"]
 
+        for pg in pages.values():
+            if "missing" in pg or "invalid" in pg:
+                LOGGER.warning("Page with pageid %s no longer exists.", pg.get("pageid"))
+                continue
+            page = batch[int(pg["pageid"])]
+            if "info" in props:
+                _update_info(page, _page_from_info(pg))
+            if "redirects" in props:
+                page.redirects = [ WikipediaEntryID(ns=int(redir["ns"]), title=redir["title"], pageid=int(redir["pageid"])) for redir in pg.get("redirects", []) ]
+            if "extracts" in props:
+                page.summary = pg.get("extract", "").strip()
+            if "categories" in props:
+                page.categories = [ WikipediaEntry(ns=int(c["ns"]), title=_intern(c["title"])) for c in pg.get("categories", []) ]
+            if "langlinks" in props:
+                page.languages = [ _language_link(l) for l in pg.get("langlinks", []) ]
+            touch_page(page)
+    return wiki_pages
+
+def iter_recent_changes(since: str, until="", namespaces="", prefetch=False, resume: dict = None, transport: WikipediaTransport = None) -> "QueryStream":
+    """
+    Streams the pages edited, created, moved or deleted since a timestamp, from oldest to newest change.
+    A page appears once per change. The server only keeps the changes of the last 30 days.
+    https://www.mediawiki.org/wiki/API:RecentChanges
+    @arg since: ISO 8601 timestamp (such as "2024-01-31T00:00:00Z") of the oldest change to list.
+    @arg until: Timestamp of the newest change to list. By default, up to now.
+    @arg namespaces: Namespaces to list changes from, separated by "|". By default, all of them.
+    @return a QueryStream of WikipediaEntryID objects (pages deleted have pageid 0).
+    """
+    query_params = {
+        "action": "query",
+        "format": "json",
+        "list": "recentchanges",
+        "rcdir": "newer",
+        "rcstart": since,
+        "rcprop": "title|ids",
+        "rctype": "edit|new|log",
+        "rclimit": "max"
+    }
+    if until != "":
+        query_params["rcend"] = until
+    if namespaces != "":
+        query_params["rcnamespace"] = namespaces
+    return QueryStream(query_params, "recentchanges", transport, resume, prefetch)
+
+def _changed_pages(wiki_pages: Sequence[WikipediaEntryPage], transport: WikipediaTransport) -> Tuple[list, list]:
+    """
+    Compares the revision of every page with the current one, with a single info query per batch of WIKI_MAX_TITLES pages.
+    The information fields of the pages that changed are updated.
+    @return (pages that changed, pages that no longer exist)
+    """
+    changed = []
+    deleted = []
+    for i in range(0, len(wiki_pages), WIKI_MAX_TITLES):
+        batch = { page.pageid: page for page in wiki_pages[i:i + WIKI_MAX_TITLES] }
+        query_params = {
+            "action": "query",
+            "format": "json",
+            "pageids": "|".join(str(pageid) for pageid in batch),
+            "prop": "info",
+            "inprop": "url|talkid"
+        }
+        # @info Never cached, since it's what tells whether cached responses are still valid
+        pages = {}
+        for res in _query_continued(query_params, transport):
+            _merge_query_pages(pages, res["query"].get("pages", {}))
+        current = { int(pg["pageid"]): pg for pg in pages.values() if "missing" not in pg and "invalid" not in pg }
+        for pageid, page in batch.items():
+            pg = current.get(pageid)
+            if pg is None:
+                deleted.append(page)
+                continue
+            info = _page_from_info(pg)
+            if page_revision(info) != page_revision(page) or info.title != page.title:
+                _update_info(page, info)
+                changed.append(page)
+    return changed, deleted
+
+def refresh_pages(wiki_pages: Sequence[WikipediaEntryPage], since: str = None, transport: WikipediaTransport = None) -> Tuple[list, list]:
+    """
+    Brings pages up to date, making requests only for the ones that changed. Their information fields are updated,
+    and the cached fields they had retrieved (summary, sections and their text, categories, languages, redirects and html)
+    are discarded and retrieved again, in batches whenever possible. Cached responses of a changed page are never
+    used again, since they belong to its previous revision.
+    Pages are found to have changed by comparing their revision with the current one, with one request per
+    WIKI_MAX_TITLES pages. If since is given, only the pages that appear in the recent changes since that timestamp
+    are compared, which takes fewer requests when the pages are many and the changes are few.
+    @arg since: ISO 8601 timestamp of the last refresh (at most 30 days ago, see iter_recent_changes()).
+    @return (pages that changed, pages that no longer exist)
+    """
+    if transport is None:
+        transport = get_default_transport()
+    if since is not None:
+        by_id = { page.pageid: page for page in wiki_pages }
+        by_title = { page.title: page for page in wiki_pages }
+        namespaces = "|".join(sorted({ str(page.ns) for page in wiki_pages }))
+        candidates = {}
+        if wiki_pages:
+            for change in iter_recent_changes(since, namespaces=namespaces, transport=transport):
+                page = by_id.get(change.pageid) or by_title.get(change.title)
+                if page is not None:
+                    candidates[page.pageid] = page
+        wiki_pages = list(candidates.values())
+    changed, deleted = _changed_pages(list(wiki_pages), transport)
+
+    # @info Cached fields are discarded before retrieving any of them again, so none is left from the previous revision
+    stale = {}
+    for page in changed:
+        fields = { field for field in ("summary", "categories", "languages", "redirects", "sections", "rawhtml", "redirecttarget") if getattr(page, field) is not None }
+        texts = [ type_text for type_text in ("wikitext", "text") if any(getattr(s, type_text) is not None for s in page.sections or []) ]
+        stale[page.pageid] = (fields, texts)
+        for field in fields:
+            setattr(page, field, None)
+    # @optimization Every page is hydrated once, with all the props it needs: pages needing the same ones share the requests
+    hydrations = {}
+    for page in changed:
+        props = tuple(prop for field, prop in (("summary", "extracts"), ("categories", "categories"), ("languages", "langlinks"), ("redirects", "redirects")) if field in stale[page.pageid][0])
+        if props:
+            hydrations.setdefault(props, []).append(page)
+    for props, pages in hydrations.items():
+        hydrate(pages, props, transport)
+    resolve_redirects([ page for page in changed if "redirecttarget" in stale[page.pageid][0] ], transport)
+    for page in changed:
+        fields, texts = stale[page.pageid]
+        if "sections" in fields:
+            for type_text in texts:
+                split_sections(page, type_text, transport)
+            if not texts:
+                get_sections(page, transport)
+        if "rawhtml" in fields:
+            page.html = transport.fetch(page.fullurl, revision=page_revision(page))
+        touch_page(page)
+    LOGGER.info("Refreshed %d pages: %d changed and %d no longer exist.", len(wiki_pages), len(changed), len(deleted))
+    return changed, deleted
+
+def _download_image(url: str, path: str, transport: WikipediaTransport) -> ImageDownload:
+    """
+    Downloads a single image to path, streaming it in chunks.
+    Files that already exist with the expected size are skipped, and partial downloads (path + ".part")
+    are resumed with a Range request if the server allows it.
+    """
+    part_path = path + ".part"
+    headers = {}
+    if not os.path.exists(path) and os.path.exists(part_path):
+        headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+    try:
+        if os.path.exists(path):
+            # @optimization The size is checked with a HEAD request, so images already downloaded aren't transferred again
+            with transport.head(url, allow_redirects=True) as req:
+                if req.ok and req.headers.get("Content-Length") == str(os.path.getsize(path)):
+                    return ImageDownload(url=url, path=path, status="skipped", size=os.path.getsize(path), sha256=_file_sha256(path).hexdigest())
+        with transport.get(url, stream=True, headers=headers) as req:
+            if req.status_code == 416 and "Range" in headers:
+                # @info Nothing is left to download: the process stopped after the last chunk was written, but
+                # before the file was renamed. If its size isn't the one of the image, it's downloaded again.
+                complete = req.headers.get("Content-Range", "").rpartition("/")[2] == str(os.path.getsize(part_path))
+                if not complete:
+                    os.remove(part_path)
+                    return _download_image(url, path, transport)
+                os.replace(part_path, path)
+                return ImageDownload(url=url, path=path, status="resumed", size=os.path.getsize(path), sha256=_file_sha256(path).hexdigest())
+            req.raise_for_status()
+            resumed = req.status_code == 206
+            sha256 = _file_sha256(part_path) if resumed else hashlib.sha256()
+            with open(part_path, "ab" if resumed else "wb") as f:
+                for chunk in req.iter_content(chunk_size=IMAGE_CHUNK_SIZE):
+                    f.write(chunk)
+                    sha256.update(chunk)
+        os.replace(part_path, path)
+    except (requests.RequestException, OSError) as e:
+        LOGGER.warning("Image with URL = < %s > could not be downloaded: %s", url, e)
+        return ImageDownload(url=url, path=path, status="failed", error=str(e))
+    return ImageDownload(url=url, path=path, status="resumed" if resumed else "downloaded", size=os.path.getsize(path), sha256=sha256.hexdigest())
+
+def _file_sha256(path: str):
+    """
+    @return hashlib object with the contents of the file at path, or an empty one if the file doesn't exist.
+    """
+    sha256 = hashlib.sha256()
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(IMAGE_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+    return sha256
+
+def download_images(wiki_page: WikipediaEntryPage, base_directory="imgs\\", max_workers=8, progress=False, transport: WikipediaTransport = None) -> list:
+    """
+    Downloads all images found in a webpage to the specified directory, several at a time.
+    Images are deduplicated by URL before downloading and by content afterwards (duplicate files are removed).
+    Images already downloaded are skipped and partial downloads are resumed, so it can be called again after a failure.
+    Note that behaviour is non-blocking, meaning that encountering an error will not stop the method from attempting to download the rest of images found.
+    @arg max_workers: Maximum amount of images downloaded at the same time.
+    @arg progress: If True, shows a progress bar.
+    @return a list of ImageDownload, one for each different image found.
+    """
+    if transport is None:
+        transport = get_default_transport()
     directory = os.path.join(base_directory, wiki_page.title)
 
     if not os.path.isdir(directory):
         os.makedirs(directory)
-    if not wiki_page.html:
-        wiki_page.html = get_html(wiki_page.fullurl)
-    imgs = wiki_page.html.find_all('img')
-    for img in tqdm(imgs):
-        img_url = img.attrs.get("src")
-        if img_url:
-            img_url = urllib.parse.urljoin(wiki_page.fullurl, img_url)
-            img_url = img_url.split('?')[0] # Remove Query Params
-            LOGGER.info("Downloading image from %s into %s", img_url, directory)
-            try:
-                download(img_url, directory) # Download using wget
-                imgs_downloaded += 1
-            except:
-                LOGGER.warning("Image with URL = < %s > could not be downloaded.", img_url)
-                continue
+    # @optimization Only the img elements are parsed. Their urls are absolute, unique and without query parameters.
+    img_urls = _parse_html(_page_raw(wiki_page, transport), transport, find_images, wiki_page.fullurl)
+
+    paths = {} # Image URL -> Path it's downloaded to
+    filenames = set()
+    for img_url in img_urls:
+        # @info The name is decoded before it's taken from the path, so encoded separators (%2F) can't reach other directories
+        filename = urllib.parse.unquote(urllib.parse.urlsplit(img_url).path).replace("\\", "/").rsplit("/", 1)[-1]
+        if filename in ("", ".", "..", IMAGE_DUPLICATES_FILE):
+            filename = "image"
+        name, ext = os.path.splitext(filename)
+        copy = 1
+        while filename in filenames:
+            filename = f"{name} ({copy}){ext}"
+            copy += 1
+        filenames.add(filename)
+        path = os.path.join(directory, filename)
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(directory):
+            LOGGER.warning("Image with URL = < %s > is not downloaded, since its name would place it outside of %s", img_url, directory)
+            continue
+        paths[img_url] = path
+
+    # @optimization Duplicates found by previous calls are remembered, so they aren't downloaded again only to be removed
+    duplicates_path = os.path.join(directory, IMAGE_DUPLICATES_FILE)
+    duplicates = {} # Image URL -> Filename of the first copy
+    if os.path.exists(duplicates_path):
+        with open(duplicates_path, encoding="utf-8") as f:
+            duplicates = json.load(f)
+    results = {}
+    for url in paths:
+        original = os.path.join(directory, os.path.basename(duplicates.get(url, "")))
+        if url in duplicates and os.path.isfile(original):
+            results[url] = ImageDownload(url=url, path=paths[url], status="skipped", size=os.path.getsize(original), sha256=_file_sha256(original).hexdigest())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = { executor.submit(_download_image, url, path, transport): url for url, path in paths.items() if url not in results }
+        LOGGER.info("Downloading %d images into %s", len(futures), directory)
+        for future in tqdm(as_completed(futures), total=len(futures), disable=not progress):
+            results[futures[future]] = future.result()
 
-    # Cleanup of .tmp files
-    files_found = [f for f in os.listdir() if f.endswith(".tmp")]
-    for f in files_found:
-        os.remove(f)
-    return (imgs_downloaded, len(imgs))
+    # @info Different URLs may serve the same image, only the first copy is kept
+    originals = {}
+    downloads = []
+    for url in paths:
+        result = results[url]
+        if result.sha256 is not None:
+            if result.sha256 in originals:
+                if os.path.exists(result.path):
+                    os.remove(result.path)
+                result.status = "duplicate"
+                result.path = originals[result.sha256]
+                duplicates[url] = os.path.basename(result.path)
+            else:
+                originals[result.sha256] = result.path
+        downloads.append(result)
+    if duplicates:
+        with open(duplicates_path, "w", encoding="utf-8") as f:
+            json.dump(duplicates, f)
+    return downloads
+
+def get_all_imgs(wiki_page: WikipediaEntryPage, base_directory="imgs\\", transport: WikipediaTransport = None) -> Tuple[int, int]:
+    """
+    Downloads all images found in a webpage to the specified directory, showing a progress bar.
+    See download_images() for the results of each image.
+    @returns integer tuple that contains the amount of images downloaded (or already present) and the total amount of different images encountered. 
+    Note that behaviour is non-blocking, meaning that encountering an error will not stop the method from attempting to download the rest of images found.
+    """
+    downloads = download_images(wiki_page, base_directory, progress=True, transport=transport)
+    imgs_downloaded = sum(1 for d in downloads if d.status != "failed")
+    return (imgs_downloaded, len(downloads))
 
 class Enpyclopedia:
 
-    def __init__(self, encyclopedia="ALL"):
+    def __init__(self, encyclopedia="ALL", transport: WikipediaTransport = None, api_url=WIKI_API_URL, pool_size=10, cache: ResponseCache = None, max_pages=None, max_pages_bytes=None, metrics: Metrics = None, index: SearchIndex = None):
         """
-        Constructor that takes a single parameter: what kind of encyclopedia we are going to use.
+        Constructor whose main parameter is what kind of encyclopedia we are going to use.
         By Default, the member encyclopedia is 'ALL', meaning that it will try to find the 
         information in all supported encyclopedias.
+        All requests made by this object go through its own WikipediaTransport, which keeps connections
+        alive between requests. Either an existing transport is given (so it can be shared with other 
+        objects and functions), or one is created using api_url, pool_size, cache and metrics.
+        Found pages are kept in self.pages, a PageStore that evicts the least recently used pages
+        once there are more than max_pages of them, or once they use more than max_pages_bytes of memory.
+        The encyclopedia can also be a local Wikipedia dump, either as a WikipediaDump or as the path of a
+        multistream dump (*.xml.bz2). Pages are then read from the dump instead of the API (see dump.py).
+        If an index is given, the pages can be searched locally (see search() and search.py). Pages are indexed
+        as they are found and whenever more of their content is retrieved, and the content retrieved for them
+        stays searchable once they are evicted from the store.
+        """
+        if isinstance(encyclopedia, str) and encyclopedia.endswith(".xml.bz2"):
+            from .dump import WikipediaDump # @info Imported here since it depends on this module
+            encyclopedia = WikipediaDump(encyclopedia)
+        if not isinstance(encyclopedia, str):
+            # @info A dump answers the same queries as the API, so it takes the place of the transport
+            self.encyclopedia = "WIKIPEDIA"
+            self.transport = encyclopedia
+        else:
+            self.encyclopedia = encyclopedia.upper()
+            self.transport = transport if transport is not None else WikipediaTransport(api_url=api_url, pool_size=pool_size, cache=cache, metrics=metrics)
+        self.index = index
+        self.pages = PageStore(max_entries=max_pages, max_bytes=max_pages_bytes, on_evict=index.add if index is not None else None, on_update=index.add if index is not None else None) # All querried pages/sites for later access
+        self.last_refresh = None # Time of the last call to refresh(), see refresh()
+
+    @property
+    def metrics(self) -> Metrics:
+        """
+        Metrics of the requests made by this object (those of its transport), or None if its backend has none.
         """
-        self.encyclopedia = encyclopedia.upper()
-        self.pages = [] # List of all querried pages/sites for later access
-        self.last_page_index = -1 # Index of the last page in the pages list, starts at -1 (no last page)
+        return getattr(self.transport, "metrics", None)
 
-    def find(self, to_find: str) -> bool:
+    def _operation(self, name: str):
+        """
+        Context in which the requests made are attributed to the operation name in the metrics.
+        """
+        return self.metrics.operation(name) if self.metrics is not None else nullcontext()
+
+    @property
+    def last_page_index(self) -> int:
+        """
+        Index of the last page found (or used) in the pages store, -1 if there is none.
+        """
+        return len(self.pages) - 1
+
+    def find(self, to_find: str) -> WikipediaEntryPage:
         """
         Method that finds specific information on the appropriate online encyclopedia.
         It can be either a string containing the information to search for or link.
         If the page exists, it creates a WikipediaEntryPage object and stores 
-        all necessary information. The object is then added to the self.pages list.
-        The last_page_index is then incremented.
-        If the page doesn't exist, it returns False
-        If at least one page is found, it returns True.
+        all necessary information. The object is then added to the self.pages store,
+        where it becomes the last page (self.pages[self.last_page_index]).
+        If the page had already been found, the stored page is returned and no request is made.
+        If the page doesn't exist, it returns None
+        If the page is found, it returns its WikipediaEntryPage.
 
         """
 
-        match_found = False
+        match_found = None
 
         if self.encyclopedia == "WIKIPEDIA" or self.encyclopedia == "ALL":
-            S = requests.Session()
-            title = to_find
-            # @info Basic Link checking, the more robust option would involve regex but
-            # for our purposes I think that would be overkill.
-            if "https://" in to_find or "http://" in to_find:
-                # We want the title of the page if we know the link.
-                # This is essentially the last part of the url string
-                title = to_find.split('/')
-                title = title[len(title) - 1]
+            title = _title_from_link(to_find)
+            match_found = self.pages.get(title, redirects=False)
+            if match_found is not None:
+                LOGGER.info("Page '%s' had already been found. Returning the stored page to avoid unnecessary requests.", title)
+                return match_found
             query_params = {
                 "action": "query",
                 "format": "json",
@@ -406,18 +1164,159 @@ class Enpyclopedia:
                 "prop": "info|redirects",
                 "inprop": "url|talkid"
             }
-            req = S.get(url=WIKI_API_URL, params=query_params)
-            LOGGER.info("Request URL: %s", req.url)
-
-            for k, pg in req.json()["query"]["pages"].items():
+            with self._operation("find"):
+                res = self.transport.query(query_params)
+            for k, pg in res["query"]["pages"].items():
                 if k != "-1":
-                    page = WikipediaEntryPage(ns=pg["ns"], title=pg["title"], pageid=int(pg["pageid"]), contentmodel=pg["contentmodel"], pagelanguage=pg["pagelanguage"], pagelanguagehtmlcode=pg["pagelanguagehtmlcode"], pagelanguagedir=pg["pagelanguagedir"], touched=pg["touched"], lastrevid=int(pg["lastrevid"]), length=int(pg["length"]), talkid=int(pg["talkid"]), fullurl=pg["fullurl"], editurl=pg["editurl"], canonicalurl=pg["canonicalurl"])
-                    if "redirects" in pg.keys():
-                        page.redirects = [ WikipediaEntryID(ns=int(redir["ns"]), title=redir["title"], pageid=int(redir["pageid"])) for redir in pg["redirects"] ]
-                    self.pages.append(page)
-                    self.last_page_index += 1
-                    match_found = True
+                    match_found = self.pages.add(_page_from_info(pg), aliases=[title])
             
         if self.encyclopedia == "OMNIGLOT" or self.encyclopedia == "ALL":
             pass
         return match_found
+
+    def hydrate(self, wiki_pages: Sequence[WikipediaEntryPage] = None, props=("extracts", "categories", "langlinks")) -> Sequence[WikipediaEntryPage]:
+        """
+        Calls hydrate() with this object's transport. If no pages are given, all stored pages are hydrated.
+        """
+        if wiki_pages is None:
+            wiki_pages = list(self.pages)
+        with self._operation("hydrate"):
+            return hydrate(wiki_pages, props, self.transport)
+
+    def resolve_redirects(self, wiki_pages: Sequence[WikipediaEntryPage] = None) -> dict:
+        """
+        Calls resolve_redirects() with this object's transport. If no pages are given, all stored pages are resolved.
+        """
+        if wiki_pages is None:
+            wiki_pages = list(self.pages)
+        with self._operation("resolve_redirects"):
+            return resolve_redirects(wiki_pages, self.transport)
+
+    def refresh(self, wiki_pages: Sequence[WikipediaEntryPage] = None, since: str = None) -> Tuple[list, list]:
+        """
+        Calls refresh_pages() with this object's transport. If no pages are given, all stored pages are refreshed.
+        Pages that no longer exist are removed from the store, and pages that were moved are indexed by their new title.
+        The time of every refresh is kept in self.last_refresh, to be given as since to the next one.
+        @return (pages that changed, pages that no longer exist)
+        """
+        if wiki_pages is None:
+            wiki_pages = list(self.pages)
+        # @info Taken before any request, so changes made while refreshing are listed by the next refresh
+        started = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        with self._operation("refresh"):
+            changed, deleted = refresh_pages(wiki_pages, since, self.transport)
+        for page in deleted:
+            self.pages.remove(page.pageid)
+            if self.index is not None:
+                self.index.remove(page.pageid)
+        for page in changed:
+            if page.pageid in self.pages:
+                self.pages.add(page)
+        if self.index is not None:
+            self.index.add_many([ page for page in changed if page.pageid in self.index ])
+        self.last_refresh = started
+        return changed, deleted
+
+    def index_pages(self, wiki_pages: Sequence[WikipediaEntryPage] = None) -> int:
+        """
+        Adds the title, summary and sections (with their text) retrieved for the pages to the search index,
+        replacing what had been indexed of them before. If no pages are given, all stored pages are indexed.
+        @return Amount of pages indexed (those whose content hadn't changed since they were last indexed are skipped),
+        or None if this object has no index.
+        """
+        if self.index is None:
+            LOGGER.error("This Enpyclopedia has no search index. Create it with index=SearchIndex(path).")
+            return None
+        if wiki_pages is None:
+            wiki_pages = list(self.pages)
+        return self.index.add_many(wiki_pages)
+
+    def search(self, query: str, limit=10) -> list:
+        """
+        Searches the indexed pages locally, without making any requests (see index_pages()).
+        @return list of up to limit SearchResult (pageid, title and BM25 score), from best to worst,
+        or None if this object has no index.
+        """
+        if self.index is None:
+            LOGGER.error("This Enpyclopedia has no search index. Create it with index=SearchIndex(path).")
+            return None
+        return self.index.search(query, limit)
+
+    def find_many(self, to_find: Iterable[str], redirects=False) -> dict:
+        """
+        Batched version of find(). Each element can be either a title or a link, just like in find().
+        Titles are sent to the API in batches of WIKI_MAX_TITLES, so finding N pages takes about N / 50 requests
+        instead of N. Every page found is added to the self.pages store, and pages that had already been found
+        are taken from it without making any requests, just like in find().
+        @arg redirects: If True, elements that are redirects are resolved to the page they redirect to.
+        @return dict that maps each element of to_find to its WikipediaEntryPage, or to None if the page doesn't exist.
+        """
+        found = {}
+        if self.encyclopedia == "WIKIPEDIA" or self.encyclopedia == "ALL":
+            batch = {} # Title -> Elements of to_find with that title
+            for elem in to_find:
+                title = _title_from_link(elem)
+                stored = self.pages.get(title, redirects=redirects)
+                if redirects and stored is not None and stored.redirect:
+                    # @info Redirects found by find() are stored as they are, so they are resolved to their target
+                    # (from the store if it has already been found, otherwise through the batch)
+                    stored = self.pages.get(stored.redirecttarget, redirects=False) if stored.redirecttarget else None
+                found[elem] = stored
+                if found[elem] is not None:
+                    continue
+                batch.setdefault(title, []).append(elem)
+                if len(batch) == WIKI_MAX_TITLES:
+                    with self._operation("find_many"):
+                        self._find_batch(batch, redirects, found)
+                    batch = {}
+            if batch:
+                with self._operation("find_many"):
+                    self._find_batch(batch, redirects, found)
+        else:
+            found = { elem: None for elem in to_find }
+        return found
+
+    def _find_batch(self, batch: dict, redirects: bool, found: dict):
+        """
+        Finds up to WIKI_MAX_TITLES titles with a single query (plus continuations of the redirects list).
+        The API normalizes titles (and resolves redirects if asked to), so each element is mapped
+        back to its page through the 'normalized' and 'redirects' lists of the response.
+        """
+        query_params = {
+            "action": "query",
+            "format": "json",
+            "titles": "|".join(batch.keys()),
+            "prop": "info|redirects",
+            "inprop": "url|talkid",
+            "rdlimit": "max"
+        }
+        if redirects:
+            query_params["redirects"] = 1
+        normalized = {}
+        redirected = {}
+        pages = {}
+        for res in _query_continued(query_params, self.transport):
+            query = res["query"]
+            normalized.update({ n["from"]: n["to"] for n in query.get("normalized", []) })
+            redirected.update({ r["from"]: r["to"] for r in query.get("redirects", []) })
+            _merge_query_pages(pages, query.get("pages", {}))
+
+        by_title = {}
+        for pg in pages.values():
+            if "missing" in pg or "invalid" in pg:
+                continue
+            page = self.pages.add(_page_from_info(pg))
+            by_title[pg["title"]] = page
+
+        for title, elems in batch.items():
+            target = normalized.get(title, title)
+            is_redirect = target in redirected
+            target = redirected.get(target, target)
+            page = by_title.get(target)
+            if page is None:
+                LOGGER.warning("No page found for '%s'.", elems[0])
+            elif not is_redirect:
+                # @info Un-normalized titles are stored as aliases, so they are found without requests next time
+                self.pages.add(page, aliases=[title])
+            for elem in elems:
+                found[elem] = page
@@ -0,0 +1,74 @@
+"""
+Command line interface of Enpyclopedia.
+
+    python -m enpyclopedia export titles.txt -o export/
+    cat titles.txt | python -m enpyclopedia export - -o export/ --fields summary,categories
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+from . import Enpyclopedia, WIKI_API_URL, WIKI_MAX_TITLES
+from .dump import WikipediaDump
+from .export import DEFAULT_EXPORT_FIELDS, DUMP_EXPORT_FIELDS, EXPORT_FIELDS, export_pages, read_titles
+
+def _export(args) -> int:
+    if args.fields is None:
+        fields = tuple(field for field in DEFAULT_EXPORT_FIELDS if not args.dump or field in DUMP_EXPORT_FIELDS)
+    else:
+        fields = tuple(field for field in args.fields.split(",") if field)
+    if args.dump:
+        # @info Summaries and other languages need the API, so every page would fail
+        unsupported = [ field for field in fields if field not in DUMP_EXPORT_FIELDS and field in EXPORT_FIELDS ]
+        if unsupported:
+            print(f"Fields {unsupported} can't be retrieved from a dump. Available fields: {', '.join(DUMP_EXPORT_FIELDS)}", file=sys.stderr)
+            return 2
+    encyclopedia = "ALL"
+    if args.dump:
+        # @info The dump is opened here, whatever its name, so a wrong path is reported instead of finding nothing
+        if not os.path.isfile(args.dump):
+            print(f"Dump {args.dump} not found", file=sys.stderr)
+            return 2
+        try:
+            encyclopedia = WikipediaDump(args.dump, args.dump_index)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Could not open the dump {args.dump}: {e}", file=sys.stderr)
+            return 2
+    enc = Enpyclopedia(encyclopedia, api_url=args.api_url, pool_size=args.workers, max_pages=4 * args.workers * WIKI_MAX_TITLES)
+    try:
+        stats = export_pages(read_titles(args.input), args.output, fields, args.workers, args.shard_size, not args.no_compress, not args.restart, enc)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        enc.transport.close()
+    print(json.dumps(stats), file=sys.stderr)
+    # @info An export that found pages but couldn't retrieve any of them failed
+    return 1 if stats["records"] == 0 and stats["failed"] > 0 else 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m enpyclopedia", description="Enpyclopedia command line tools.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log the progress.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Export pages to sharded, compressed JSON lines.")
+    export.add_argument("input", help="File with one title (or link) per line, or - to read them from stdin.")
+    export.add_argument("-o", "--output", required=True, help="Directory the shards and the checkpoint are written to.")
+    export.add_argument("--fields", help=f"Comma separated fields to retrieve, any of: {', '.join(EXPORT_FIELDS)} (only {', '.join(DUMP_EXPORT_FIELDS)} with --dump). Defaults to {','.join(DEFAULT_EXPORT_FIELDS)}, without the fields a dump doesn't have.")
+    export.add_argument("--workers", type=int, default=8, help="Batches of titles retrieved at the same time.")
+    export.add_argument("--shard-size", type=int, default=10000, help="Maximum amount of pages per shard.")
+    export.add_argument("--no-compress", action="store_true", help="Write plain JSON lines instead of gzip-compressed ones.")
+    export.add_argument("--restart", action="store_true", help="Ignore the checkpoint of a previous export and start over.")
+    export.add_argument("--api-url", default=WIKI_API_URL, help="MediaWiki API endpoint to query.")
+    export.add_argument("--dump", help="Read the pages from a local multistream dump (*.xml.bz2) instead of the API.")
+    export.add_argument("--dump-index", help="Index of the dump. By default, its path with -index.txt.bz2 instead of .xml.bz2.")
+    export.set_defaults(run=_export)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR, format="%(asctime)s %(levelname)s %(message)s")
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+asyncio interface to Enpyclopedia.
+Every coroutine runs its blocking counterpart in a bounded pool of worker threads that share
+a single pooled WikipediaTransport, so an event loop can await thousands of pages at once
+without being blocked, while never having more than max_concurrency requests in flight.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Union
+from . import Enpyclopedia, WikipediaEntry, WikipediaEntryPage, WikipediaSection, WIKI_API_URL
+from . import get_html, get_summary, get_wiki_text, get_other_languages, get_sections, get_categories, get_category_members, get_all_pages
+from .transport import WikipediaTransport
+
+class AsyncEnpyclopedia:
+    """
+    Asynchronous counterpart of Enpyclopedia. Its coroutines return the same dataclasses as the
+    synchronous functions, and found pages are stored in the same self.pages store (see PageStore).
+    """
+
+    def __init__(self, encyclopedia="ALL", transport: WikipediaTransport = None, api_url=WIKI_API_URL, max_concurrency=20):
+        """
+        @arg max_concurrency: Maximum amount of requests in flight at the same time.
+        It's also the size of the connection pool when no transport is given.
+        """
+        self.enpyclopedia = Enpyclopedia(encyclopedia, transport=transport, api_url=api_url, pool_size=max_concurrency)
+        self.transport = self.enpyclopedia.transport
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="enpyclopedia")
+
+    @property
+    def pages(self):
+        return self.enpyclopedia.pages
+
+    @property
+    def last_page_index(self):
+        return self.enpyclopedia.last_page_index
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def find(self, to_find: str) -> WikipediaEntryPage:
+        return await self._run(self.enpyclopedia.find, to_find)
+
+    async def find_many(self, to_find: Iterable[str], redirects=False) -> dict:
+        return await self._run(self.enpyclopedia.find_many, list(to_find), redirects)
+
+    async def get_html(self, url: str):
+        return await self._run(get_html, url, transport=self.transport)
+
+    async def get_summary(self, wiki_page: WikipediaEntryPage) -> str:
+        return await self._run(get_summary, wiki_page, transport=self.transport)
+
+    async def get_wiki_text(self, wiki_data: Union[WikipediaEntryPage, WikipediaSection], type_text="text") -> str:
+        return await self._run(get_wiki_text, wiki_data, type_text, transport=self.transport)
+
+    async def get_other_languages(self, wiki_page: WikipediaEntryPage) -> list:
+        return await self._run(get_other_languages, wiki_page, transport=self.transport)
+
+    async def get_sections(self, wiki_page: WikipediaEntryPage) -> list:
+        return await self._run(get_sections, wiki_page, transport=self.transport)
+
+    async def get_categories(self, wiki_page: WikipediaEntryPage) -> list:
+        return await self._run(get_categories, wiki_page, transport=self.transport)
+
+    async def get_category_members(self, wiki_category: WikipediaEntry, **kwargs) -> list:
+        """
+        Accepts the same keyword arguments as get_category_members().
+        """
+        return await self._run(get_category_members, wiki_category, transport=self.transport, **kwargs)
+
+    async def get_all_pages(self, wiki_page: WikipediaEntryPage, **kwargs) -> list:
+        """
+        Accepts the same keyword arguments as get_all_pages().
+        """
+        return await self._run(get_all_pages, wiki_page, transport=self.transport, **kwargs)
+
+    async def aclose(self):
+        """
+        Waits for the worker threads to finish and closes the pooled connections.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
@@ -0,0 +1,155 @@
+"""
+Persistent cache of API and HTML responses, stored in a SQLite database.
+Responses about a specific page are stored along with the revision of the page they were
+obtained from, so they remain valid until the page is edited (or their time to live expires).
+"""
+import logging
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+
+LOGGER = logging.getLogger(__name__)
+ACCESS_FLUSH_SIZE = 256 # Access times kept in memory before they are written to the database
+
+def page_revision(wiki_page) -> str:
+    """
+    Revision string of a WikipediaEntryPage. It changes whenever the page is edited (lastrevid)
+    or re-rendered, for example because a template it uses was edited (touched).
+    """
+    return f"{wiki_page.lastrevid}|{wiki_page.touched}"
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with time to live, LRU eviction bounded by the amount of
+    entries and/or their total size, and hit/miss counters. It is thread-safe.
+    """
+
+    def __init__(self, path="enpyclopedia_cache.sqlite", ttl=None, max_entries=None, max_bytes=None):
+        """
+        @arg path: Path of the SQLite database. It's created if it doesn't exist.
+        @arg ttl: Seconds an entry is valid for, even if its revision matches. None means forever.
+        @arg max_entries: Maximum amount of entries stored. None means no limit.
+        @arg max_bytes: Maximum size (compressed) of all entries stored. None means no limit.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # @optimization With a write-ahead log, commits don't have to wait for the database file to be synced to disk
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._accessed = {} # Key -> Time of its last hit, not written yet
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, revision TEXT, created REAL, accessed REAL, size INTEGER, body BLOB)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+        self._entries, self._bytes = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
+    @staticmethod
+    def key_for(url: str, params=None) -> str:
+        """
+        Normalized key of a request: the same parameters in any order (or as a query string) give the same key.
+        """
+        if params is None:
+            return url
+        if isinstance(params, str):
+            items = urllib.parse.parse_qsl(params, keep_blank_values=True)
+        else:
+            items = [ (k, "" if v is None else str(v)) for k, v in params.items() ]
+        return f"{url}?{urllib.parse.urlencode(sorted(items))}"
+
+    def get(self, key: str, revision: str = None) -> bytes:
+        """
+        @return The response stored under key, or None if there is none, it has expired or it belongs to another revision.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT revision, created, body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            stored_revision, created, body = row
+            if stored_revision != revision or (self.ttl is not None and time.time() - created > self.ttl):
+                self.misses += 1
+                self.stale += 1
+                self._delete(key)
+                self._db.commit()
+                return None
+            self.hits += 1
+            # @optimization Hits only change the access time, which is written along with others instead of on every read
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_accessed()
+                self._db.commit()
+        return zlib.decompress(body)
+
+    def set(self, key: str, body: bytes, revision: str = None):
+        """
+        Stores a response, replacing any previous one with the same key, and evicts the least
+        recently used entries if the cache grows over its limits.
+        """
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._db.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)", (key, revision, now, now, len(compressed), compressed))
+            self._entries += 1
+            self._bytes += len(compressed)
+            self._evict()
+            self._db.commit()
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._delete(key)
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._accessed.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._entries = 0
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale, "evictions": self.evictions, "entries": self._entries, "bytes": self._bytes}
+
+    def close(self):
+        with self._lock:
+            self._flush_accessed()
+            self._db.commit()
+            self._db.close()
+
+    def _flush_accessed(self):
+        if self._accessed:
+            self._db.executemany("UPDATE responses SET accessed = ? WHERE key = ?", [ (accessed, key) for key, accessed in self._accessed.items() ])
+            self._accessed.clear()
+
+    def _delete(self, key: str):
+        self._accessed.pop(key, None)
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._entries -= 1
+            self._bytes -= row[0]
+
+    def _evict(self):
+        if (self.max_entries is not None and self._entries > self.max_entries) or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            self._flush_accessed() # The least recently used entries are found with the latest access times
+        while (self.max_entries is not None and self._entries > self.max_entries) or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if (self.max_entries is None or self._entries <= self.max_entries) and (self.max_bytes is None or self._bytes <= self.max_bytes):
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._entries -= 1
+                self._bytes -= size
+                self.evictions += 1
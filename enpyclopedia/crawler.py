@@ -0,0 +1,131 @@
+"""
+Breadth-first crawler of the Wikipedia category graph.
+Pages and categories are expanded by a pool of worker threads, and the edges found are yielded
+as soon as they arrive, so category trees of any size can be mapped without keeping them in memory.
+"""
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Union
+from . import WikipediaEntry, WIKI_MAX_TITLES, _category_members_params, _query_continued, _merge_query_pages
+from .transport import WikipediaTransport, get_default_transport
+
+LOGGER = logging.getLogger(__name__)
+CATEGORY_NS = 14
+
+@dataclass
+class CategoryEdge:
+    """
+    Edge of the category graph. Its kind is one of:
+    - "category": source (a page or category) belongs to the target category.
+    - "subcategory": target is a subcategory of the source category.
+    - "member": target is a page (not a category) that belongs to the source category.
+    The depth is the one of the source plus one (seeds have depth 0).
+    """
+    source: str
+    target: str
+    kind: str
+    depth: int
+
+def _parent_categories(nodes: list, transport: WikipediaTransport) -> tuple:
+    """
+    Retrieves the categories of up to WIKI_MAX_TITLES nodes with a single query (plus its continuations).
+    @return (edges, None), like _category_members().
+    """
+    query_params = {
+        "action": "query",
+        "format": "json",
+        "titles": "|".join(title for title, _, _ in nodes),
+        "prop": "categories",
+        "cllimit": "max"
+    }
+    depths = { title: depth for title, _, depth in nodes }
+    normalized = {}
+    pages = {}
+    for res in _query_continued(query_params, transport):
+        normalized.update({ n["to"]: n["from"] for n in res["query"].get("normalized", []) })
+        _merge_query_pages(pages, res["query"].get("pages", {}))
+    edges = []
+    for pg in pages.values():
+        source = normalized.get(pg["title"], pg["title"])
+        for c in pg.get("categories", []):
+            edges.append(CategoryEdge(source=source, target=c["title"], kind="category", depth=depths[source] + 1))
+    return edges, None
+
+def _category_members(category: str, depth: int, include_pages: bool, transport: WikipediaTransport, continuation: dict = None) -> tuple:
+    """
+    Retrieves one batch of the subcategories (and pages, if include_pages) of a category, so that large
+    categories are never held in memory as a whole.
+    @arg continuation: 'continue' token of the batch, None for the first one.
+    @return (edges, continuation of the next batch, or None if it was the last one)
+    """
+    query_params = _category_members_params(WikipediaEntry(ns=CATEGORY_NS, title=category), "max", "", "", "", "page|subcat" if include_pages else "subcat", "", "", "", "", "")
+    if query_params is None:
+        return [], None
+    res = transport.query({**query_params, **(continuation or {})})
+    edges = [ CategoryEdge(source=category, target=m["title"], kind="subcategory" if int(m["ns"]) == CATEGORY_NS else "member", depth=depth + 1) for m in res["query"]["categorymembers"] ]
+    return edges, res.get("continue")
+
+def crawl_categories(seeds: Iterable[Union[WikipediaEntry, str]], max_depth=None, max_nodes=None, workers=8, include_pages=False, upward=False, transport: WikipediaTransport = None) -> Iterator[CategoryEdge]:
+    """
+    Traverses the category graph breadth-first from the seeds, which can be pages or categories
+    (as WikipediaEntry objects, or as titles), and yields every CategoryEdge as soon as it's found.
+    By default, pages are expanded to the categories they belong to, and categories to their subcategories.
+    Every node is expanded once, so cycles and subcategories shared by several categories are only visited once.
+    @arg max_depth: Nodes further than max_depth edges from the seeds are not expanded. None means no limit.
+    @arg max_nodes: Maximum amount of nodes visited (expanded or waiting to be). None means no limit.
+    Edges to nodes found once the limit is reached are still yielded, but those nodes are not visited.
+    @arg workers: Amount of nodes expanded at the same time.
+    @arg include_pages: If True, categories are also expanded to the pages that belong to them ("member" edges), which are not visited.
+    @arg upward: If True, every node (including categories) is expanded to the categories it belongs to instead, so the graph is traversed towards its roots.
+    @return Generator of CategoryEdge.
+    """
+    if transport is None:
+        transport = get_default_transport()
+    visited = set()
+    pending = deque() # (title, ns, depth) of the nodes waiting to be expanded
+
+    def visit(title: str, ns: int, depth: int):
+        if title in visited or (max_nodes is not None and len(visited) >= max_nodes):
+            return
+        visited.add(title)
+        if max_depth is None or depth < max_depth:
+            pending.append((title, ns, depth))
+
+    for seed in seeds:
+        if isinstance(seed, WikipediaEntry):
+            visit(seed.title, seed.ns, 0)
+        else:
+            visit(seed, CATEGORY_NS if seed.startswith("Category:") else 0, 0)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = set()
+        categories = {} # Future retrieving members -> (title, depth) of its category
+        while pending or running:
+            # @info Only a few tasks are submitted ahead of time, so the frontier stays in the (compact) pending queue
+            while pending and len(running) < 2 * workers:
+                if upward or pending[0][1] != CATEGORY_NS:
+                    batch = []
+                    while pending and len(batch) < WIKI_MAX_TITLES and (upward or pending[0][1] != CATEGORY_NS):
+                        batch.append(pending.popleft())
+                    running.add(executor.submit(_parent_categories, batch, transport))
+                else:
+                    title, _, depth = pending.popleft()
+                    future = executor.submit(_category_members, title, depth, include_pages, transport)
+                    categories[future] = (title, depth)
+                    running.add(future)
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                edges, continuation = future.result()
+                category = categories.pop(future, None)
+                # @info The next batch of a large category is requested while this one is yielded
+                if continuation is not None:
+                    next_batch = executor.submit(_category_members, *category, include_pages, transport, continuation)
+                    categories[next_batch] = category
+                    running.add(next_batch)
+                for edge in edges:
+                    if edge.kind != "member":
+                        visit(edge.target, CATEGORY_NS, edge.depth)
+                    yield edge
+    LOGGER.info("Category crawl finished after visiting %d nodes.", len(visited))
@@ -0,0 +1,368 @@
+"""
+Offline backend that answers queries from a local Wikipedia XML dump instead of the live API.
+It reads the multistream dumps (pages-articles-multistream.xml.bz2), which are made of many small bz2
+streams of about 100 pages each, along with their index of the stream every page is in. The dump is
+memory-mapped and only the stream holding a page is decompressed, so any page is found without scanning the dump.
+See https://meta.wikimedia.org/wiki/Data_dumps
+"""
+import bz2
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from html import escape
+from typing import Iterable
+from . import _section_from_parse, _split_wikitext
+from .store import normalize_title
+from .transport import WikipediaAPIError
+
+LOGGER = logging.getLogger(__name__)
+PAGES_PER_STREAM = 100 # Pages in each bz2 stream of the dumps published by Wikimedia
+CACHED_STREAMS = 8 # Decompressed streams kept in memory, since pages found together are often in the same stream
+# @info Headings must take a whole line, as in MediaWiki. Comments are blanked before looking for them.
+HEADING_RE = re.compile(rb"^(={1,6})(.+?)(={1,6})[ \t]*$", re.MULTILINE)
+COMMENT_RE = re.compile(rb"<!--.*?(-->|\Z)", re.DOTALL)
+
+def _blank(match) -> bytes:
+    return b" " * len(match.group(0))
+
+def _heading_line(heading: str) -> str:
+    """
+    Approximates the text MediaWiki displays for a heading: links are replaced by their label and bold/italics are removed.
+    """
+    heading = re.sub(r"\[\[(?:[^\]|]*\|)?([^\]]*)\]\]", r"\1", heading)
+    return heading.replace("'''", "").replace("''", "").strip()
+
+def wikitext_sections(title: str, wikitext: str) -> list:
+    """
+    Finds the sections of a page in its wikitext, in the same format as action=parse&prop=sections.
+    Sections added by templates can't be found without expanding them, so only the ones written in the page are returned.
+    @return list of dict, one for each section.
+    """
+    raw = COMMENT_RE.sub(_blank, wikitext.encode("utf-8"))
+    sections = []
+    levels = [] # Levels of the sections enclosing the current one
+    numbers = [] # Number of the current section at each toclevel
+    for match in HEADING_RE.finditer(raw):
+        level = min(len(match.group(1)), len(match.group(3)))
+        # @info Unbalanced '=' belong to the heading's text, as in MediaWiki
+        text = (b"=" * (len(match.group(1)) - level) + match.group(2) + b"=" * (len(match.group(3)) - level)).decode("utf-8").strip()
+        if not text:
+            continue
+        while levels and levels[-1] >= level:
+            levels.pop()
+        levels.append(level)
+        toclevel = len(levels)
+        del numbers[toclevel:]
+        while len(numbers) < toclevel:
+            numbers.append(0)
+        numbers[-1] += 1
+        line = _heading_line(text)
+        sections.append({
+            "toclevel": toclevel,
+            "level": str(level),
+            "line": line,
+            "number": ".".join(str(n) for n in numbers),
+            "index": str(len(sections) + 1),
+            "fromtitle": title.replace(" ", "_"),
+            "byteoffset": match.start(),
+            "anchor": line.replace(" ", "_")
+        })
+    return sections
+
+def build_dump_index(index_path: str, database_path: str):
+    """
+    Converts the index of a multistream dump (pages-articles-multistream-index.txt.bz2, with one 'offset:pageid:title'
+    line per page) into a SQLite database, so that lookups don't need the whole index in memory.
+    It only has to be done once: WikipediaDump does it the first time it's given an index without its database.
+    """
+    LOGGER.info("Building the dump index database '%s' from '%s'. This may take a while.", database_path, index_path)
+    opener = bz2.open if index_path.endswith(".bz2") else open
+    db = sqlite3.connect(database_path)
+    db.execute("CREATE TABLE IF NOT EXISTS pages (title TEXT PRIMARY KEY, pageid INTEGER, offset INTEGER)")
+    with opener(index_path, "rt", encoding="utf-8") as index:
+        rows = ((title, int(pageid), int(offset)) for offset, pageid, title in (line.rstrip("\n").split(":", 2) for line in index if line.strip()))
+        db.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", rows)
+    db.execute("CREATE INDEX IF NOT EXISTS pages_pageid ON pages (pageid)")
+    db.execute("CREATE INDEX IF NOT EXISTS pages_offset ON pages (offset)")
+    db.commit()
+    db.close()
+
+class WikipediaDump:
+    """
+    Read-only, thread-safe backend over a local multistream dump. It can be used in place of a WikipediaTransport:
+    give it to Enpyclopedia (Enpyclopedia(encyclopedia=WikipediaDump(...))) or to any function as its transport.
+    It answers the queries made by find(), find_many(), get_wiki_text(type_text="wikitext"), get_sections(),
+    split_sections(type_text="wikitext"), get_categories() and resolve_redirects(). Anything that needs the
+    MediaWiki parser or data that isn't in the dump (html, extracts, language links, lists) raises WikipediaAPIError.
+    """
+
+    def __init__(self, dump_path: str, index_path: str = None, database_path: str = None):
+        """
+        @arg dump_path: Path of the pages-articles-multistream.xml.bz2 dump.
+        @arg index_path: Path of its pages-articles-multistream-index.txt.bz2 index. By default, the dump's
+        path with "-index.txt.bz2" instead of ".xml.bz2".
+        @arg database_path: Path of the SQLite database built from the index. By default, the index's path with ".sqlite" appended.
+        It's built the first time it's needed.
+        """
+        if index_path is None:
+            index_path = re.sub(r"\.xml\.bz2$", "", dump_path) + "-index.txt.bz2"
+        if database_path is None:
+            database_path = index_path + ".sqlite"
+        if not os.path.exists(database_path):
+            build_dump_index(index_path, database_path)
+        self.dump_path = dump_path
+        self.api_url = dump_path
+        self._file = open(dump_path, "rb")
+        self._dump = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._db = sqlite3.connect(database_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._streams = OrderedDict() # Offset -> { title: page } of the most recently used streams
+        self._read_siteinfo()
+
+    def _read_siteinfo(self):
+        """
+        Reads the site's url, language and namespaces from the header of the dump, which is its first stream.
+        """
+        first = self._db.execute("SELECT MIN(offset) FROM pages").fetchone()[0]
+        header = bz2.decompress(self._dump[:first or len(self._dump)]).decode("utf-8")
+        base = re.search(r"<base>(.*?)</base>", header)
+        dbname = re.search(r"<dbname>(.*?)</dbname>", header)
+        self.base_url = base.group(1).rsplit("/", 1)[0] + "/" if base else "https://en.wikipedia.org/wiki/"
+        self.language = re.sub(r"wiki$", "", dbname.group(1)) if dbname else "en"
+        self.namespaces = {} # Lowercase namespace name -> (key, name)
+        for key, name in re.findall(r'<namespace key="(-?\d+)"[^>]*>(.*?)</namespace>', header):
+            self.namespaces[name.lower()] = (int(key), name)
+        self.category_namespace = next((name for key, name in self.namespaces.values() if key == 14), "Category")
+
+    def normalize(self, title: str) -> str:
+        """
+        Normalizes a title like MediaWiki does, including the first letter after a namespace prefix.
+        """
+        title = normalize_title(re.sub(r"[ _]+", " ", title))
+        prefix, sep, rest = title.partition(":")
+        if sep and prefix.strip().lower() in self.namespaces:
+            return f"{self.namespaces[prefix.strip().lower()][1]}:{normalize_title(rest)}"
+        return title
+
+    def page(self, title: str = None, pageid: int = None) -> dict:
+        """
+        Reads a page from the dump, by title or by pageid.
+        @return dict with its title, ns, id, revid, timestamp, model, text and redirect (its target, or None), or None if it isn't in the dump.
+        """
+        with self._lock:
+            if pageid is not None:
+                row = self._db.execute("SELECT title, offset FROM pages WHERE pageid = ?", (pageid,)).fetchone()
+            else:
+                title = self.normalize(title)
+                row = self._db.execute("SELECT title, offset FROM pages WHERE title = ?", (title,)).fetchone()
+            if row is None:
+                return None
+            title, offset = row
+            return self._stream(offset).get(title)
+
+    def _stream(self, offset: int) -> dict:
+        """
+        Decompresses and parses the stream starting at offset (only the memory-mapped bytes of that stream are read).
+        Must be called with the lock held.
+        """
+        pages = self._streams.get(offset)
+        if pages is not None:
+            self._streams.move_to_end(offset)
+            return pages
+        end = self._db.execute("SELECT MIN(offset) FROM pages WHERE offset > ?", (offset,)).fetchone()[0]
+        data = bz2.BZ2Decompressor().decompress(self._dump[offset:end or len(self._dump)])
+        pages = {}
+        for elem in ET.fromstring(b"<pages>" + data + b"</pages>").iter("page"):
+            redirect = elem.find("redirect")
+            revision = elem.find("revision")
+            pages[elem.findtext("title")] = {
+                "title": elem.findtext("title"),
+                "ns": int(elem.findtext("ns")),
+                "id": int(elem.findtext("id")),
+                "revid": int(revision.findtext("id")),
+                "timestamp": revision.findtext("timestamp"),
+                "model": revision.findtext("model") or "wikitext",
+                "text": revision.findtext("text") or "",
+                "redirect": redirect.get("title").split("#")[0] if redirect is not None else None
+            }
+        self._streams[offset] = pages
+        if len(self._streams) > CACHED_STREAMS:
+            self._streams.popitem(last=False)
+        return pages
+
+    def categories(self, page: dict) -> list:
+        """
+        Categories the page is added to in its wikitext (the ones added by templates can't be found without expanding them).
+        """
+        names = "|".join(re.escape(name) for name, (key, _) in self.namespaces.items() if key == 14) or "category"
+        found = []
+        for match in re.finditer(rf"\[\[\s*(?:{names})\s*:([^\]|]+)(?:\|[^\]]*)?\]\]", page["text"], re.IGNORECASE):
+            title = f"{self.category_namespace}:{normalize_title(match.group(1))}"
+            if title not in found:
+                found.append(title)
+        return found
+
+    def _info(self, page: dict) -> dict:
+        """
+        Page in the same format as prop=info with inprop=url.
+        """
+        url = self.base_url + urllib.parse.quote(page["title"].replace(" ", "_"))
+        info = {
+            "pageid": page["id"],
+            "ns": page["ns"],
+            "title": page["title"],
+            "contentmodel": page["model"],
+            "pagelanguage": self.language,
+            "pagelanguagehtmlcode": self.language,
+            "pagelanguagedir": "ltr",
+            "touched": page["timestamp"],
+            "lastrevid": page["revid"],
+            "length": len(page["text"].encode("utf-8")),
+            "fullurl": url,
+            "editurl": f"{url}?action=edit",
+            "canonicalurl": url
+        }
+        if page["redirect"] is not None:
+            info["redirect"] = ""
+        return info
+
+    def query(self, params, revision: str = None) -> dict:
+        """
+        Answers a MediaWiki API query from the dump, in the same format as the API.
+        @arg params: Either a dict or an already built query string.
+        @arg revision: Ignored, since the dump doesn't change.
+        @raise WikipediaAPIError if the page doesn't exist (action=parse) or the query can't be answered from a dump.
+        """
+        if isinstance(params, str):
+            params = dict(urllib.parse.parse_qsl(params, keep_blank_values=True))
+        params = { k: "" if v is None else str(v) for k, v in params.items() }
+        if params.get("action") == "parse":
+            return self._parse(params)
+        if params.get("action") == "query" and "list" not in params:
+            return self._query(params)
+        raise WikipediaAPIError("unsupported", f"This query can't be answered from a dump: {params}")
+
+    def _query(self, params: dict) -> dict:
+        props = set(filter(None, params.get("prop", "").split("|")))
+        unsupported = props - {"info", "redirects", "categories"}
+        if unsupported:
+            raise WikipediaAPIError("unsupported", f"The dump has no data for prop={'|'.join(sorted(unsupported))}.")
+        query = {"pages": {}}
+        normalized, redirects = [], []
+        missing = -1
+        if "pageids" in params:
+            found = [ (int(pageid), self.page(pageid=int(pageid))) for pageid in params["pageids"].split("|") ]
+        else:
+            found = []
+            for title in params.get("titles", "").split("|"):
+                if self.normalize(title) != title:
+                    normalized.append({"from": title, "to": self.normalize(title)})
+                found.append((self.normalize(title), self.page(title)))
+        for title, page in found:
+            if page is not None and page["redirect"] is not None and "redirects" in params:
+                target = self.page(page["redirect"])
+                redirects.append({"from": page["title"], "to": target["title"] if target else self.normalize(page["redirect"])})
+                title, page = self.normalize(page["redirect"]), target
+            if page is None and isinstance(title, int):
+                query["pages"][str(title)] = {"pageid": title, "missing": ""}
+                continue
+            if page is None:
+                query["pages"][str(missing)] = {"ns": 0, "title": title, "missing": ""}
+                missing -= 1
+                continue
+            pg = self._info(page) if "info" in props else {"pageid": page["id"], "ns": page["ns"], "title": page["title"]}
+            if "categories" in props:
+                pg["categories"] = [ {"ns": 14, "title": category} for category in self.categories(page) ]
+            # @info Pages redirecting to this one (prop=redirects) can't be found without a full scan, so they are never listed
+            query["pages"][str(page["id"])] = pg
+        if normalized:
+            query["normalized"] = normalized
+        if redirects:
+            query["redirects"] = redirects
+        return {"batchcomplete": "", "query": query}
+
+    def _parse(self, params: dict) -> dict:
+        props = set(filter(None, params.get("prop", "").split("|")))
+        unsupported = props - {"sections", "wikitext"}
+        if unsupported:
+            raise WikipediaAPIError("unsupported", f"The dump can't be parsed for prop={'|'.join(sorted(unsupported))}.")
+        page = self.page(params.get("page", ""))
+        if page is None:
+            raise WikipediaAPIError("missingtitle", "The page you specified doesn't exist.")
+        parsed = {"title": page["title"], "pageid": page["id"]}
+        sections = wikitext_sections(page["title"], page["text"])
+        text = page["text"]
+        if params.get("section"):
+            index = int(params["section"])
+            if index == 0:
+                end = sections[0]["byteoffset"] if sections else len(text.encode("utf-8"))
+                text = text.encode("utf-8")[:end].decode("utf-8").rstrip(" \t\n\r\0\x0b")
+            elif index <= len(sections):
+                split = [ _section_from_parse(s) for s in sections ]
+                _split_wikitext(split, text)
+                text = split[index - 1].wikitext
+            else:
+                raise WikipediaAPIError("nosuchsection", f"There is no section {index} in {page['title']}.")
+            sections = []
+        if "sections" in props:
+            parsed["sections"] = sections
+        if "wikitext" in props:
+            parsed["wikitext"] = {"*": text}
+        return {"parse": parsed}
+
+    def fetch(self, url: str, params=None, revision: str = None) -> bytes:
+        raise WikipediaAPIError("unsupported", f"The dump has no html or files ({url}).")
+
+    def get(self, url: str, params=None, **kwargs):
+        raise WikipediaAPIError("unsupported", f"The dump has no html or files ({url}).")
+
+    def close(self):
+        with self._lock:
+            self._streams.clear()
+            self._dump.close()
+            self._file.close()
+            self._db.close()
+
+def write_multistream_dump(dump_path: str, index_path: str, pages: Iterable[dict], base_url="https://en.wikipedia.org/wiki/Main_Page", dbname="enwiki", pages_per_stream=PAGES_PER_STREAM):
+    """
+    Writes a dump (and its index) in the same multistream format as the ones published by Wikimedia.
+    It's mostly useful to build small dumps for testing, or to store a subset of pages for offline use.
+    @arg pages: dicts with the title, ns, id and text of each page, and optionally its revid, timestamp and redirect (target title).
+    """
+    namespaces = {0: "", 14: "Category"}
+    header = (f'<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11" xml:lang="{re.sub(r"wiki$", "", dbname)}">\n'
+              f'  <siteinfo>\n    <dbname>{escape(dbname)}</dbname>\n    <base>{escape(base_url)}</base>\n    <namespaces>\n'
+              + "".join(f'      <namespace key="{key}" case="first-letter">{name}</namespace>\n' for key, name in namespaces.items())
+              + "    </namespaces>\n  </siteinfo>\n")
+    with open(dump_path, "wb") as dump, bz2.open(index_path, "wt", encoding="utf-8") as index:
+        dump.write(bz2.compress(header.encode("utf-8")))
+        block = []
+
+        def flush():
+            offset = dump.tell()
+            xml = "".join(_page_xml(page) for page in block)
+            dump.write(bz2.compress(xml.encode("utf-8")))
+            for page in block:
+                index.write(f"{offset}:{page['id']}:{page['title']}\n")
+            block.clear()
+
+        for page in pages:
+            block.append(page)
+            if len(block) == pages_per_stream:
+                flush()
+        if block:
+            flush()
+        dump.write(bz2.compress(b"</mediawiki>\n"))
+
+def _page_xml(page: dict) -> str:
+    redirect = f'    <redirect title="{escape(page["redirect"])}" />\n' if page.get("redirect") else ""
+    return (f'  <page>\n    <title>{escape(page["title"])}</title>\n    <ns>{page.get("ns", 0)}</ns>\n    <id>{page["id"]}</id>\n{redirect}'
+            f'    <revision>\n      <id>{page.get("revid", page["id"])}</id>\n      <timestamp>{page.get("timestamp", "2024-01-01T00:00:00Z")}</timestamp>\n'
+            f'      <model>wikitext</model>\n      <format>text/x-wiki</format>\n      <text bytes="{len(page["text"].encode("utf-8"))}" xml:space="preserve">{escape(page["text"], quote=False)}</text>\n'
+            f'    </revision>\n  </page>\n')
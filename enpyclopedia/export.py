@@ -0,0 +1,217 @@
+"""
+Bulk export of pages to sharded, compressed JSON lines.
+Titles are streamed from any iterable (such as a file or stdin) through a bounded pool of workers, each of them
+finding and hydrating a batch of pages with batched requests. Only a few batches are ever in flight, and they are
+written in input order, so memory use doesn't depend on the amount of titles. After every batch, the progress
+is saved to a checkpoint, and an interrupted export resumes right where it stopped.
+"""
+import dataclasses
+import gzip
+import json
+import logging
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+from . import Enpyclopedia, WIKI_MAX_TITLES, WikipediaEntryPage, get_sections, hydrate, split_sections
+
+LOGGER = logging.getLogger(__name__)
+EXPORT_FIELDS = ("summary", "sections", "categories", "languages", "wikitext")
+DEFAULT_EXPORT_FIELDS = ("summary", "sections", "categories")
+DUMP_EXPORT_FIELDS = ("sections", "categories", "wikitext") # Fields that can be retrieved from a local dump
+HYDRATE_PROPS = {"summary": "extracts", "categories": "categories", "languages": "langlinks"} # Fields retrieved in batches by hydrate()
+CHECKPOINT_FILE = "checkpoint.json"
+FAILED_FILE = "failed.txt"
+
+def read_titles(source: str) -> Iterator[str]:
+    """
+    Streams the titles (or links) in a file, one per line, skipping blank lines. "-" reads them from stdin.
+    """
+    lines = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        for line in lines:
+            title = line.strip()
+            if title:
+                yield title
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+def page_record(wiki_page: WikipediaEntryPage) -> dict:
+    """
+    Fields of a page (and of its sections, categories...) as a JSON-serializable dict. The html isn't included.
+    """
+    record = dataclasses.asdict(wiki_page)
+    del record["rawhtml"]
+    return record
+
+class ShardWriter:
+    """
+    Writes JSON lines to numbered shards of up to shard_size records (pages-00000.jsonl.gz, pages-00001.jsonl.gz...).
+    Every call to write() is flushed to disk as a separate gzip member, so a shard is always valid up to the last
+    write, and a shard can be truncated back to the size it had at any write (see state()) to discard what followed.
+    """
+
+    def __init__(self, directory: str, shard_size=10000, compress=True, shard=0, shard_records=0, shard_bytes=0):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.compress = compress
+        self.shard = shard
+        self.shard_records = shard_records
+        self._file = open(self.path, "ab")
+        self._file.truncate(shard_bytes)
+        self._file.seek(shard_bytes)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"pages-{self.shard:05d}.jsonl" + (".gz" if self.compress else ""))
+
+    def write(self, records: list):
+        while records:
+            if self.shard_records >= self.shard_size:
+                self._file.close()
+                self.shard += 1
+                self.shard_records = 0
+                self._file = open(self.path, "wb")
+            chunk = records[:self.shard_size - self.shard_records]
+            records = records[len(chunk):]
+            data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in chunk).encode("utf-8")
+            self._file.write(gzip.compress(data) if self.compress else data)
+            self.shard_records += len(chunk)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def state(self) -> dict:
+        return {"shard": self.shard, "shard_records": self.shard_records, "shard_bytes": self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+def _page_sections(enc: Enpyclopedia, wiki_page: WikipediaEntryPage, fields: tuple) -> bool:
+    """
+    Retrieves the sections of a page (and their wikitext, if asked for), which takes one request per page.
+    @return True if they could be retrieved.
+    """
+    try:
+        if "wikitext" in fields:
+            split_sections(wiki_page, "wikitext", enc.transport)
+        elif "sections" in fields:
+            get_sections(wiki_page, enc.transport)
+        return True
+    except Exception as e:
+        LOGGER.error("Could not retrieve the sections of page '%s': %s", wiki_page.title, e)
+        return False
+
+def _export_batch(enc: Enpyclopedia, titles: list, fields: tuple, sections_executor: ThreadPoolExecutor) -> tuple:
+    """
+    Finds and retrieves the fields of a batch of pages. Sections are retrieved by the sections_executor,
+    since they can't be batched.
+    @return (records, titles not found, titles that failed)
+    """
+    found = enc.find_many(titles)
+    pages = list({ page.pageid: page for page in found.values() if page is not None }.values())
+    props = [ HYDRATE_PROPS[field] for field in fields if field in HYDRATE_PROPS ]
+    if props and pages:
+        hydrate(pages, props, enc.transport)
+    failed = set()
+    if "sections" in fields or "wikitext" in fields:
+        retrieved = sections_executor.map(lambda page: _page_sections(enc, page, fields), pages)
+        failed = { page.pageid for page, ok in zip(pages, retrieved) if not ok }
+    records = []
+    for title in titles:
+        page = found[title]
+        if page is not None and page.pageid not in failed:
+            records.append(page_record(page))
+    missing = [ title for title in titles if found[title] is None ]
+    return records, missing, [ title for title in titles if found[title] is not None and found[title].pageid in failed ]
+
+def _batches(titles: Iterable[str], size: int) -> Iterator[list]:
+    batch = []
+    for title in titles:
+        batch.append(title)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def export_pages(titles: Iterable[str], directory: str, fields=DEFAULT_EXPORT_FIELDS, workers=8, shard_size=10000, compress=True, resume=True, enc: Enpyclopedia = None) -> dict:
+    """
+    Exports the pages with the given titles (or links) to directory, as sharded JSON lines with the fields of every page.
+    Pages that don't exist are skipped, and the titles of those that couldn't be retrieved are written to failed.txt.
+    @arg fields: Cached fields retrieved for every page, any of EXPORT_FIELDS. "wikitext" also stores the wikitext of every section.
+    @arg workers: Batches of WIKI_MAX_TITLES titles retrieved at the same time (at most twice as many are ever in flight),
+    and pages whose sections are retrieved at the same time.
+    @arg shard_size: Maximum amount of pages per shard.
+    @arg compress: If True, shards are gzip-compressed.
+    @arg resume: If True and directory has a checkpoint, the titles already exported are skipped and the export
+    continues where it stopped. Otherwise, the export starts over.
+    @arg enc: Enpyclopedia used to find the pages. By default, a new one.
+    @return dict with the amount of titles read, records written, and pages missing or failed.
+    """
+    unknown = set(fields) - set(EXPORT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields {sorted(unknown)}. Available fields: {', '.join(EXPORT_FIELDS)}")
+    os.makedirs(directory, exist_ok=True)
+    checkpoint_path = os.path.join(directory, CHECKPOINT_FILE)
+    state = {"titles": 0, "records": 0, "missing": 0, "failed": 0, "failed_bytes": 0, "shard": 0, "shard_records": 0, "shard_bytes": 0}
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            state.update(json.load(f))
+        LOGGER.info("Resuming the export after %d titles.", state["titles"])
+    if enc is None:
+        # @info The store only has to hold the batches in flight, so it's bounded to keep memory constant
+        enc = Enpyclopedia(max_pages=4 * workers * WIKI_MAX_TITLES)
+
+    titles = iter(titles)
+    for _ in range(state["titles"]):
+        if next(titles, None) is None:
+            break
+    writer = ShardWriter(directory, shard_size, compress, state["shard"], state["shard_records"], state["shard_bytes"])
+    failed_file = open(os.path.join(directory, FAILED_FILE), "ab")
+    failed_file.truncate(state["failed_bytes"])
+    failed_file.seek(state["failed_bytes"])
+
+    def save(batch: list, result: tuple):
+        records, missing, failed = result
+        writer.write(records)
+        if failed:
+            failed_file.write("".join(f"{title}\n" for title in failed).encode("utf-8"))
+            failed_file.flush()
+            os.fsync(failed_file.fileno())
+        state.update(writer.state())
+        state["titles"] += len(batch)
+        state["records"] += len(records)
+        state["missing"] += len(missing)
+        state["failed"] += len(failed)
+        state["failed_bytes"] = failed_file.tell()
+        # @info The checkpoint is replaced atomically, so a killed export always finds a complete one
+        with open(checkpoint_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+        LOGGER.info("Exported %d titles (%d pages, %d missing, %d failed).", state["titles"], state["records"], state["missing"], state["failed"])
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor, ThreadPoolExecutor(max_workers=workers) as sections_executor:
+            in_flight = deque() # (batch, future), in input order
+            for batch in _batches(titles, WIKI_MAX_TITLES):
+                # @info Backpressure: no more titles are read until the oldest batch is written
+                if len(in_flight) >= 2 * workers:
+                    _save_oldest(in_flight, save)
+                in_flight.append((batch, executor.submit(_export_batch, enc, batch, tuple(fields), sections_executor)))
+            while in_flight:
+                _save_oldest(in_flight, save)
+    finally:
+        writer.close()
+        failed_file.close()
+    return {key: state[key] for key in ("titles", "records", "missing", "failed")}
+
+def _save_oldest(in_flight: deque, save):
+    batch, future = in_flight.popleft()
+    try:
+        result = future.result()
+    except Exception as e:
+        LOGGER.error("Could not export a batch of %d titles starting with '%s': %s", len(batch), batch[0], e)
+        result = ([], [], batch)
+    save(batch, result)
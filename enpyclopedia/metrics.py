@@ -0,0 +1,224 @@
+"""
+Instrumentation of the requests made by Enpyclopedia.
+Every WikipediaTransport records, per endpoint, how many requests it makes, how long they take, how many bytes
+come back and how often the cache answers instead, along with the time spent parsing html. Recording is a few
+dictionary updates under a lock, cheap enough to always be on. Metrics can be read as a dict (snapshot()),
+exported as text in the Prometheus exposition format (export_text()), or followed through listeners.
+"""
+import bisect
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304) # Bytes
+
+class Histogram:
+    """
+    Histogram with fixed bucket bounds (exported cumulatively, as in Prometheus). Not thread-safe by itself.
+    """
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Approximate quantile (the upper bound of the bucket it falls in). None if nothing was observed.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "buckets": dict(zip([ str(b) for b in self.bounds ] + ["+Inf"], self.counts))}
+
+def endpoint(url: str, params=None, api_url: str = None) -> str:
+    """
+    Name of the endpoint a request goes to: "<action>:<list or prop>" for API requests
+    (such as "query:info|redirects" or "parse:sections"), "html" for articles and "file" for anything else.
+    """
+    if url == api_url:
+        if isinstance(params, str):
+            params = dict(urllib.parse.parse_qsl(params, keep_blank_values=True))
+        params = params or {}
+        return f"{params.get('action', 'unknown')}:{params.get('list') or params.get('prop') or ''}"
+    return "html" if "/wiki/" in url else "file"
+
+class Metrics:
+    """
+    Thread-safe collection of request metrics. Listeners are called with every event as it's recorded:
+    listener(event, endpoint, seconds, size), where event is one of "request", "throttled", "coalesced"
+    (an identical request already in flight was shared), "cache_hit", "cache_miss" or "parse".
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.size_buckets = size_buckets
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {} # (endpoint, status) -> count
+            self.latency = {} # endpoint -> Histogram of seconds
+            self.sizes = {} # endpoint -> Histogram of bytes
+            self.throttled = {} # endpoint -> count
+            self.coalesced = {} # endpoint -> count
+            self.cache = {} # endpoint -> [hits, misses]
+            self.parse = Histogram(self.latency_buckets)
+            self.operations = {} # operation -> {"count", "seconds", "requests", "bytes"}
+            self.started = time.time()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def _notify(self, event: str, endpoint: str, seconds=0.0, size=0):
+        for listener in self.listeners:
+            listener(event, endpoint, seconds, size)
+
+    def observe_request(self, endpoint: str, seconds: float, size: int, status: int):
+        with self._lock:
+            key = (endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram(self.latency_buckets)
+                self.sizes[endpoint] = Histogram(self.size_buckets)
+            self.latency[endpoint].observe(seconds)
+            self.sizes[endpoint].observe(size)
+            operation = getattr(self._local, "operation", None)
+            if operation is not None:
+                stats = self.operations[operation]
+                stats["requests"] += 1
+                stats["bytes"] += size
+        self._notify("request", endpoint, seconds, size)
+
+    def observe_throttled(self, endpoint: str):
+        with self._lock:
+            self.throttled[endpoint] = self.throttled.get(endpoint, 0) + 1
+        self._notify("throttled", endpoint)
+
+    def observe_coalesced(self, endpoint: str):
+        with self._lock:
+            self.coalesced[endpoint] = self.coalesced.get(endpoint, 0) + 1
+        self._notify("coalesced", endpoint)
+
+    def observe_cache(self, endpoint: str, hit: bool):
+        with self._lock:
+            counts = self.cache.setdefault(endpoint, [0, 0])
+            counts[0 if hit else 1] += 1
+        self._notify("cache_hit" if hit else "cache_miss", endpoint)
+
+    def observe_parse(self, seconds: float, size: int = 0):
+        with self._lock:
+            self.parse.observe(seconds)
+        self._notify("parse", "html", seconds, size)
+
+    @contextmanager
+    def operation(self, name: str):
+        """
+        Attributes the requests made by the calling thread inside the block to a high-level operation
+        (such as "find"), so that its cost in requests and bytes is known. Nested operations count towards the outermost one.
+        """
+        if getattr(self._local, "operation", None) is not None:
+            yield
+            return
+        with self._lock:
+            self.operations.setdefault(name, {"count": 0, "seconds": 0.0, "requests": 0, "bytes": 0})["count"] += 1
+        self._local.operation = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._local.operation = None
+            with self._lock:
+                self.operations[name]["seconds"] += time.perf_counter() - start
+
+    def snapshot(self) -> dict:
+        """
+        @return dict with all the metrics recorded so far.
+        """
+        with self._lock:
+            endpoints = {}
+            for (name, status), count in self.requests.items():
+                stats = endpoints.setdefault(name, {"requests": 0, "statuses": {}})
+                stats["requests"] += count
+                stats["statuses"][str(status)] = count
+            for name, stats in endpoints.items():
+                latency = self.latency[name]
+                stats["seconds"] = latency.sum
+                stats["p50_seconds"] = latency.quantile(0.5)
+                stats["p99_seconds"] = latency.quantile(0.99)
+                stats["bytes"] = int(self.sizes[name].sum)
+                stats["latency"] = latency.to_dict()
+                stats["sizes"] = self.sizes[name].to_dict()
+            for name, count in self.throttled.items():
+                endpoints.setdefault(name, {"requests": 0, "statuses": {}})["throttled"] = count
+            for name, count in self.coalesced.items():
+                endpoints.setdefault(name, {"requests": 0, "statuses": {}})["coalesced"] = count
+            for name, (hits, misses) in self.cache.items():
+                endpoints.setdefault(name, {"requests": 0, "statuses": {}}).update(cache_hits=hits, cache_misses=misses)
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "requests": sum(self.requests.values()),
+                "bytes": sum(int(h.sum) for h in self.sizes.values()),
+                "endpoints": endpoints,
+                "parse": self.parse.to_dict(),
+                "operations": { name: dict(stats) for name, stats in self.operations.items() }
+            }
+
+    def export_text(self, prefix="enpyclopedia") -> str:
+        """
+        @return The metrics as text in the Prometheus exposition format.
+        """
+        lines = []
+
+        def histogram(name: str, help_text: str, histograms: dict):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for labels, h in histograms.items():
+                seen = 0
+                for bound, count in zip([ str(b) for b in h.bounds ] + ["+Inf"], h.counts):
+                    seen += count
+                    lines.append(f'{prefix}_{name}_bucket{{{labels}le="{bound}"}} {seen}')
+                lines.append(f"{prefix}_{name}_sum{{{labels.rstrip(',')}}} {h.sum}")
+                lines.append(f"{prefix}_{name}_count{{{labels.rstrip(',')}}} {h.count}")
+
+        def counter(name: str, help_text: str, values: dict):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for labels, value in values.items():
+                lines.append(f"{prefix}_{name}{{{labels}}} {value}")
+
+        with self._lock:
+            counter("requests_total", "Requests made, by endpoint and status.", { f'endpoint="{e}",status="{s}"': c for (e, s), c in self.requests.items() })
+            histogram("request_seconds", "Duration of the requests, by endpoint.", { f'endpoint="{e}",': h for e, h in self.latency.items() })
+            histogram("response_bytes", "Size of the responses, by endpoint.", { f'endpoint="{e}",': h for e, h in self.sizes.items() })
+            counter("throttled_total", "Requests throttled by the server, by endpoint.", { f'endpoint="{e}"': c for e, c in self.throttled.items() })
+            counter("coalesced_total", "Requests that shared an identical request already in flight, by endpoint.", { f'endpoint="{e}"': c for e, c in self.coalesced.items() })
+            counter("cache_hits_total", "Responses found in the cache, by endpoint.", { f'endpoint="{e}"': c[0] for e, c in self.cache.items() })
+            counter("cache_misses_total", "Responses not found in the cache, by endpoint.", { f'endpoint="{e}"': c[1] for e, c in self.cache.items() })
+            histogram("parse_seconds", "Time spent parsing html.", { "": self.parse })
+            counter("operations_total", "High-level operations, by name.", { f'operation="{o}"': s["count"] for o, s in self.operations.items() })
+            counter("operation_requests_total", "Requests made by high-level operations, by name.", { f'operation="{o}"': s["requests"] for o, s in self.operations.items() })
+            counter("operation_seconds_total", "Time spent in high-level operations, by name.", { f'operation="{o}"': s["seconds"] for o, s in self.operations.items() })
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,163 @@
+"""
+Client for several language editions of Wikipedia at once.
+Every language is a different host with its own API, so each one gets its own Enpyclopedia, whose transport keeps
+a separate pool of connections to that host (the rate limiter keeps a separate budget per host as well).
+The pages linked by the langlinks of a page are found on every language wiki at the same time, with their titles
+batched per host, so multilingual corpora can be built in a single pass.
+"""
+import logging
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Sequence, Tuple
+from . import Enpyclopedia, WIKI_MAX_TITLES, WikipediaEntryPage, get_other_languages, hydrate
+from .cache import ResponseCache
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+from .transport import WikipediaTransport
+
+LOGGER = logging.getLogger(__name__)
+WIKI_LANGUAGE_API_URL = "https://{lang}.wikipedia.org/w/api.php"
+
+def parse_language_link(link: str) -> Tuple[str, str]:
+    """
+    Splits a link to a page in another language (as returned by get_other_languages()) into its language and title.
+    @return (language code, title), such as ("fr", "Pomme de terre").
+    """
+    url = urllib.parse.urlsplit(link)
+    lang = url.hostname.split(".")[0]
+    title = urllib.parse.unquote(url.path.split("/wiki/", 1)[-1]).replace("_", " ")
+    return lang, title
+
+class MultiWiki:
+    """
+    Thread-safe client of several language editions of Wikipedia. The Enpyclopedia of each language is created
+    the first time it's needed, and keeps the pages found on that wiki in its own store.
+    Pages found are tagged with their language by their pagelanguage field, and they are always returned
+    grouped by the language code of the wiki they were found on.
+    """
+
+    def __init__(self, api_url_template=WIKI_LANGUAGE_API_URL, pool_size=10, workers=8, cache: ResponseCache = None, rate_limiter: RateLimiter = None, metrics: Metrics = None, max_pages=None):
+        """
+        @arg api_url_template: API endpoint of every language, where {lang} is replaced by its code.
+        @arg pool_size: Connections kept alive per host.
+        @arg workers: Batches of titles found at the same time, across all hosts.
+        @arg cache: ResponseCache shared by every language (keys include the host, so they never collide).
+        @arg rate_limiter: RateLimiter shared by every language. By default, the process-wide one, which already
+        has a separate budget per host.
+        @arg metrics: Metrics shared by every language. By default, each language has its own.
+        @arg max_pages: Maximum amount of pages stored by the Enpyclopedia of each language (see PageStore).
+        """
+        self.api_url_template = api_url_template
+        self.pool_size = pool_size
+        self.workers = workers
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.max_pages = max_pages
+        self._wikis = {} # Language code -> Enpyclopedia
+        self._lock = threading.Lock()
+
+    def wiki(self, lang: str) -> Enpyclopedia:
+        """
+        @return The Enpyclopedia of a language, created with its own transport (and pool of connections) if needed.
+        """
+        with self._lock:
+            if lang not in self._wikis:
+                transport = WikipediaTransport(api_url=self.api_url_template.format(lang=lang), pool_size=self.pool_size, cache=self.cache, rate_limiter=self.rate_limiter, metrics=self.metrics)
+                self._wikis[lang] = Enpyclopedia(transport=transport, max_pages=self.max_pages)
+            return self._wikis[lang]
+
+    @property
+    def languages(self) -> list:
+        """
+        Codes of the languages whose Enpyclopedia has been created.
+        """
+        with self._lock:
+            return list(self._wikis)
+
+    def find_many(self, titles: dict) -> dict:
+        """
+        Finds pages on several wikis at the same time. The titles of every language are sent to its host in batches
+        of WIKI_MAX_TITLES, and the batches of all hosts are found concurrently by up to self.workers threads.
+        @arg titles: dict that maps language codes to the titles (or links) to find on their wiki.
+        @return dict that maps every language code to the result of find_many() on its wiki
+        (each title mapped to its WikipediaEntryPage, or to None if the page doesn't exist).
+        """
+        batches = []
+        for lang, lang_titles in titles.items():
+            lang_titles = list(dict.fromkeys(lang_titles))
+            for i in range(0, len(lang_titles), WIKI_MAX_TITLES):
+                batches.append((lang, lang_titles[i:i + WIKI_MAX_TITLES]))
+        found = { lang: {} for lang in titles }
+        # @info Hosts are independent, so their batches are interleaved and every host is busy at the same time
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [ (lang, executor.submit(self._find_batch, lang, batch)) for lang, batch in _interleave(batches) ]
+            for lang, future in futures:
+                found[lang].update(future.result())
+        return found
+
+    def _find_batch(self, lang: str, batch: list) -> dict:
+        try:
+            return self.wiki(lang).find_many(batch)
+        except Exception as e:
+            LOGGER.error("Could not find %d pages on the '%s' wiki: %s", len(batch), lang, e)
+            return { title: None for title in batch }
+
+    def find_translations(self, wiki_pages: Sequence[WikipediaEntryPage], languages: Iterable[str] = None, source="en") -> dict:
+        """
+        Finds the pages that the langlinks of wiki_pages link to, on every language wiki at the same time.
+        The langlinks of the pages that haven't retrieved them yet are retrieved first, in batches (see hydrate()).
+        @arg wiki_pages: Pages of the source wiki.
+        @arg languages: Codes of the languages to find the pages in. By default, all the languages they are linked to.
+        @arg source: Language code of the wiki the pages belong to.
+        @return dict that maps the title of every page to a dict that maps language codes to the page
+        in that language. Languages a page isn't linked to, or whose page couldn't be found, are left out.
+        """
+        source_transport = self.wiki(source).transport
+        missing = [ page for page in wiki_pages if page.languages is None ]
+        if missing:
+            hydrate(missing, ["langlinks"], source_transport)
+        languages = set(languages) if languages is not None else None
+
+        links = {} # Source title -> {language code: title}
+        titles = {} # Language code -> Titles to find
+        for page in wiki_pages:
+            links[page.title] = {}
+            for link in get_other_languages(page, source_transport):
+                lang, title = parse_language_link(link)
+                if languages is None or lang in languages:
+                    links[page.title][lang] = title
+                    titles.setdefault(lang, []).append(title)
+        found = self.find_many(titles)
+        LOGGER.info("Found the translations of %d pages in %d languages.", len(wiki_pages), len(titles))
+        return { source_title: { lang: found[lang][title] for lang, title in page_links.items() if found[lang].get(title) is not None } for source_title, page_links in links.items() }
+
+    def close(self):
+        """
+        Closes the pooled connections of every language.
+        """
+        with self._lock:
+            for enc in self._wikis.values():
+                enc.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _interleave(batches: list) -> list:
+    """
+    Reorders (language, batch) pairs so that consecutive batches belong to different languages whenever possible.
+    """
+    by_lang = {}
+    for lang, batch in batches:
+        by_lang.setdefault(lang, []).append(batch)
+    interleaved = []
+    while by_lang:
+        for lang in list(by_lang):
+            interleaved.append((lang, by_lang[lang].pop(0)))
+            if not by_lang[lang]:
+                del by_lang[lang]
+    return interleaved
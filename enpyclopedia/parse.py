@@ -0,0 +1,167 @@
+"""
+Parsing of the html of pages, and extraction of what Enpyclopedia needs from it.
+Parsing is CPU-bound and holds the GIL, so in a threaded program it slows down every thread waiting on the network.
+An HtmlParser runs it in a pool of processes instead, returning compact results (plain text, image urls, links and
+redirect markers) rather than parsed trees. lxml is used when it's installed, since it parses several times faster
+than Python's html.parser, and the functions that only need a few elements (find_images(), find_redirect()) only
+build those elements instead of the whole tree.
+"""
+import logging
+import re
+import urllib.parse
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+LOGGER = logging.getLogger(__name__)
+# @info Elements whose text isn't part of the text of a page
+NON_TEXT_TAGS = ("script", "style", "noscript", "link", "meta")
+CONTENT_CLASS = "mw-parser-output"
+# @info Opening tag of the content div, whose class may have other names too (such as "mw-content-ltr mw-parser-output")
+CONTENT_TAG_RE = re.compile(rf'<div\b[^>]*\bclass="[^"]*\b{CONTENT_CLASS}\b[^"]*"[^>]*>')
+CONTENT_TAG_BYTES_RE = re.compile(CONTENT_TAG_RE.pattern.encode())
+WHITESPACE_RE = re.compile(r"[ \t\r\f\v]*\n[ \t\r\f\v\n]*")
+IMG_TAG_RE = re.compile(rb"<img\b[^>]*>", re.IGNORECASE)
+
+def parse_html(raw, parse_only: SoupStrainer = None) -> BeautifulSoup:
+    """
+    Parses html (bytes or str) with the fastest parser available.
+    @arg parse_only: If given, only the elements it matches are built.
+    """
+    return BeautifulSoup(raw, HTML_PARSER, parse_only=parse_only)
+
+@dataclass
+class ParsedHtml:
+    """
+    What extract_html() finds in the html of a page. Urls are absolute, and they are listed once, in order of appearance.
+    - text: Plain text of the content of the page (or of the whole document, if it has no content div).
+    - images: Urls of the images, without query parameters.
+    - links: Urls of the links.
+    - redirect: Title of the page it redirects to if it was reached through a redirect, otherwise None.
+    """
+    text: str
+    images: tuple
+    links: tuple
+    redirect: str = None
+
+def _unique(values) -> tuple:
+    return tuple(dict.fromkeys(values))
+
+def _image_urls(html: BeautifulSoup, base_url: str) -> tuple:
+    return _unique(urllib.parse.urljoin(base_url or "", img["src"]).split("?")[0] for img in html.find_all("img") if img.get("src"))
+
+def _redirect(html: BeautifulSoup) -> str:
+    if html.find("span", {"class": "mw-redirectedfrom"}):
+        heading = html.find("h1", {"id": "firstHeading"})
+        if heading is not None:
+            return heading.get_text()
+    return None
+
+def _text(html: BeautifulSoup) -> str:
+    for tag in html.find_all(NON_TEXT_TAGS):
+        tag.decompose()
+    return WHITESPACE_RE.sub("\n", html.get_text()).strip()
+
+def html_text(html) -> str:
+    """
+    Plain text of html (bytes or str), such as the one returned by get_wiki_text() with type_text="text".
+    Paragraphs are kept as separate lines, and scripts and styles are left out.
+    """
+    return _text(parse_html(html))
+
+def extract_html(raw, base_url: str = None) -> ParsedHtml:
+    """
+    Parses the html of a page once and extracts its text, images, links and redirect marker.
+    @arg base_url: Url of the page, which relative urls are joined with.
+    """
+    html = parse_html(raw)
+    images = _image_urls(html, base_url)
+    links = _unique(urllib.parse.urljoin(base_url or "", a["href"]) for a in html.find_all("a") if a.get("href") and not a["href"].startswith("#"))
+    redirect = _redirect(html)
+    content = html.find("div", {"class": CONTENT_CLASS})
+    return ParsedHtml(text=_text(content if content is not None else html), images=images, links=links, redirect=redirect)
+
+def _bytes(raw) -> bytes:
+    return raw.encode("utf-8") if isinstance(raw, str) else raw
+
+def find_images(raw, base_url: str = None) -> tuple:
+    """
+    Fast path of extract_html() for the urls of the images: the img tags are found without tokenizing the rest
+    of the document, and only they are parsed.
+    """
+    tags = IMG_TAG_RE.findall(_bytes(raw))
+    return _image_urls(parse_html(b"".join(tags), SoupStrainer("img")), base_url)
+
+def _redirect_element(name: str, attrs: dict) -> bool:
+    # @info While parsing, the class attribute is still the string found in the html
+    classes = attrs.get("class") or ""
+    classes = classes.split() if isinstance(classes, str) else classes
+    return (name == "span" and "mw-redirectedfrom" in classes) or (name == "h1" and attrs.get("id") == "firstHeading")
+
+def find_redirect(raw) -> str:
+    """
+    Fast path of extract_html() for the redirect marker: only the heading and the "Redirected from" notice are built,
+    and the content of the page, which comes after them, isn't parsed at all.
+    @return Title of the page it redirects to if it was reached through a redirect, otherwise None.
+    """
+    raw = _bytes(raw)
+    # @info The class name alone can also be found in the styles of the page, the attribute is only found in its content div
+    content = CONTENT_TAG_BYTES_RE.search(raw)
+    return _redirect(parse_html(raw[:content.start()] if content is not None else raw, SoupStrainer(_redirect_element)))
+
+class HtmlParser:
+    """
+    Runs the extraction functions of this module in a pool of processes, so parsing doesn't hold the GIL of the
+    threads waiting on the network. Every method blocks the calling thread (without holding the GIL) until its
+    result is ready, and submit() returns a Future instead. It's thread-safe, and can be used as a context manager.
+    Sending the html to another process isn't free, so for small documents the fast paths in the calling thread
+    (find_images(), find_redirect()) may be just as fast.
+    """
+
+    def __init__(self, processes: int = None):
+        """
+        @arg processes: Processes of the pool. None means one per CPU, and 0 means parsing in the calling thread.
+        """
+        self.processes = processes
+        self._executor = ProcessPoolExecutor(max_workers=processes) if processes != 0 else None
+
+    def submit(self, func, *args) -> Future:
+        """
+        Runs func(*args) in the pool. func must be a module-level function, such as extract_html or find_images.
+        """
+        if self._executor is not None:
+            return self._executor.submit(func, *args)
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def extract(self, raw, base_url: str = None) -> ParsedHtml:
+        return self.submit(extract_html, raw, base_url).result()
+
+    def images(self, raw, base_url: str = None) -> tuple:
+        return self.submit(find_images, raw, base_url).result()
+
+    def redirect(self, raw) -> str:
+        return self.submit(find_redirect, raw).result()
+
+    def text(self, html) -> str:
+        return self.submit(html_text, html).result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
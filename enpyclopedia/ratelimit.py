@@ -0,0 +1,133 @@
+"""
+Process-wide rate limiting of the requests made by Enpyclopedia.
+Every host has its own token bucket, so the API, the article html and the images are limited independently.
+Buckets adapt to the server: they slow down when it reports lag or throttles requests, and speed
+back up to their budget as requests succeed again.
+"""
+import logging
+import threading
+import time
+import urllib.parse
+
+LOGGER = logging.getLogger(__name__)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing rate requests per second, with bursts of up to capacity requests.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, min_rate: float = None):
+        """
+        @arg rate: Requests per second allowed (the budget). None means no limit.
+        @arg capacity: Maximum burst of requests. Defaults to one second worth of requests.
+        @arg min_rate: The rate is never decreased below this. Defaults to a tenth of the budget.
+        """
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate or 1.0)
+        self.min_rate = min_rate if min_rate is not None else (rate / 10 if rate else None)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Waits until a request can be made.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            if self.rate is not None:
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                # @info Tokens may go negative: each caller reserves its token and waits for its turn
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+        if wait > 0:
+            time.sleep(wait)
+
+    def throttle(self, delay: float):
+        """
+        Blocks every request for delay seconds and halves the rate (multiplicative decrease).
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            if self.rate is not None:
+                self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeed(self):
+        """
+        Increases the rate back towards the budget (additive increase).
+        """
+        if self.rate is not None and self.rate < self.base_rate:
+            with self._lock:
+                self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+class RateLimiter:
+    """
+    Set of TokenBuckets, one per host, each with its own budget.
+    """
+
+    def __init__(self, default_rate: float = 20, default_capacity: float = None, budgets: dict = None):
+        """
+        @arg default_rate: Requests per second allowed for hosts without a budget. None means no limit.
+        @arg default_capacity: Maximum burst for hosts without a budget.
+        @arg budgets: dict that maps a host (such as "en.wikipedia.org") to its requests per second,
+        or to a (requests per second, maximum burst) tuple.
+        """
+        self.default_rate = default_rate
+        self.default_capacity = default_capacity
+        self.budgets = dict(budgets or {})
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        """
+        @return The TokenBucket of the host of url (or of url itself, if it's a host).
+        """
+        host = urllib.parse.urlsplit(url).hostname or url
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(host)
+                if bucket is None:
+                    budget = self.budgets.get(host, (self.default_rate, self.default_capacity))
+                    rate, capacity = budget if isinstance(budget, tuple) else (budget, None)
+                    bucket = TokenBucket(rate, capacity)
+                    self._buckets[host] = bucket
+        return bucket
+
+    def acquire(self, url: str):
+        self.bucket(url).acquire()
+
+    def throttle(self, url: str, delay: float):
+        LOGGER.warning("Requests to %s are being throttled by the server. Waiting %.1f seconds.", urllib.parse.urlsplit(url).hostname, delay)
+        self.bucket(url).throttle(delay)
+
+    def succeed(self, url: str):
+        self.bucket(url).succeed()
+
+# @info The default rate limiter is shared by every transport that isn't given one explicitly
+_DEFAULT_RATE_LIMITER = None
+_DEFAULT_RATE_LIMITER_LOCK = threading.Lock()
+
+def get_default_rate_limiter() -> RateLimiter:
+    """
+    Returns the process-wide rate limiter, creating it the first time it's needed.
+    """
+    global _DEFAULT_RATE_LIMITER
+    if _DEFAULT_RATE_LIMITER is None:
+        with _DEFAULT_RATE_LIMITER_LOCK:
+            if _DEFAULT_RATE_LIMITER is None:
+                _DEFAULT_RATE_LIMITER = RateLimiter()
+    return _DEFAULT_RATE_LIMITER
+
+def set_default_rate_limiter(rate_limiter: RateLimiter):
+    """
+    Replaces the process-wide rate limiter used by transports that aren't given one explicitly.
+    """
+    global _DEFAULT_RATE_LIMITER
+    with _DEFAULT_RATE_LIMITER_LOCK:
+        _DEFAULT_RATE_LIMITER = rate_limiter
@@ -0,0 +1,195 @@
+"""
+Local full-text search over the pages retrieved by Enpyclopedia.
+Titles, summaries and the text of the sections of every page are kept in an inverted index stored in a SQLite
+database, using its FTS5 extension: terms and their postings are stored in compressed b-tree segments that are
+merged incrementally as pages are added, updated and removed, and results are ranked with BM25 inside SQLite.
+Queries are answered from disk without any requests and without loading the index in memory.
+See https://www.sqlite.org/fts5.html and https://en.wikipedia.org/wiki/Okapi_BM25
+"""
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import unicodedata
+import zlib
+from dataclasses import dataclass
+from typing import Iterable
+
+LOGGER = logging.getLogger(__name__)
+# @info Weight of the terms found in each column, in BM25 (title, summary, sections)
+TITLE_WEIGHT = 3.0
+SUMMARY_WEIGHT = 1.5
+SECTIONS_WEIGHT = 1.0
+COMMON_TERM_FRACTION = 0.5 # Terms in more pages than this fraction are left out of queries whose rarer terms find enough pages
+# @info Markup that isn't text: html tags, references and the names of the templates, files and categories used
+MARKUP_RE = re.compile(r"<ref[^>]*/>|<ref.*?</ref>|<[^>]+>|\{\{[^{}|]*|\[\[(?:Category|File|Image):[^\]]*\]\]", re.DOTALL | re.IGNORECASE)
+
+def page_text(wiki_page) -> tuple:
+    """
+    Text of a WikipediaEntryPage that is indexed: its title, its summary, and the headings and text
+    (wikitext, otherwise html) of the sections that have been retrieved, without markup.
+    @return (title, summary, sections)
+    """
+    sections = []
+    for section in wiki_page.sections or []:
+        text = section.wikitext if section.wikitext is not None else section.text
+        sections.append(section.line)
+        if text:
+            sections.append(MARKUP_RE.sub(" ", text))
+    return (wiki_page.title, wiki_page.summary or "", "\n".join(sections))
+
+def tokenize(text: str) -> list:
+    """
+    Splits text into terms the way the index does: lowercase sequences of letters and digits, without diacritics.
+    """
+    text = "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+    return [ term for term in re.split(r"[\W_]+", text) if term ]
+
+@dataclass
+class SearchResult:
+    """
+    Page found by SearchIndex.search(), along with its BM25 score (higher is better).
+    """
+    pageid: int
+    title: str
+    score: float
+
+class SearchIndex:
+    """
+    Thread-safe inverted index of pages, stored in a SQLite database (which needs the FTS5 extension,
+    included in the SQLite of most Python builds), ranking results with BM25.
+    Pages are indexed by pageid: adding a page again replaces what was indexed of it (or does nothing, if its
+    text hasn't changed), so pages can be added again every time more of their content is retrieved.
+    """
+
+    def __init__(self, path="enpyclopedia_index.sqlite"):
+        """
+        @arg path: Path of the SQLite database. It's created if it doesn't exist.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # @optimization Pages are indexed one by one as their content is retrieved, so commits have to be cheap:
+        # with a write-ahead log, they don't wait for the database file to be synced to disk
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # @optimization The index doesn't store the text it's built from (content=''). Removing a page needs
+        # the text it was indexed with, so it's kept apart, compressed, along with a digest to skip unchanged pages.
+        self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(title, summary, sections, content='', tokenize='unicode61 remove_diacritics 2')")
+        self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS vocab USING fts5vocab(pages, 'row')")
+        self._db.execute("CREATE TABLE IF NOT EXISTS docs (pageid INTEGER PRIMARY KEY, title TEXT, digest BLOB, text BLOB)")
+        self._db.commit()
+        self._docs = self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def add(self, wiki_page) -> bool:
+        """
+        Indexes a page (or re-indexes it, if it was already indexed).
+        @return True if the page was indexed, False if its text hadn't changed.
+        """
+        return self.add_many([wiki_page]) > 0
+
+    def add_many(self, wiki_pages: Iterable) -> int:
+        """
+        Indexes many pages in a single transaction, which is much faster than adding them one by one.
+        @return Amount of pages indexed (those whose text hadn't changed are skipped).
+        """
+        indexed = 0
+        with self._lock:
+            for wiki_page in wiki_pages:
+                text = page_text(wiki_page)
+                encoded = json.dumps(text, ensure_ascii=False).encode("utf-8")
+                digest = hashlib.sha1(encoded).digest()
+                row = self._db.execute("SELECT digest FROM docs WHERE pageid = ?", (wiki_page.pageid,)).fetchone()
+                if row is not None:
+                    if row[0] == digest:
+                        continue
+                    self._remove(wiki_page.pageid)
+                self._db.execute("INSERT INTO pages (rowid, title, summary, sections) VALUES (?, ?, ?, ?)", (wiki_page.pageid, *text))
+                self._db.execute("INSERT INTO docs VALUES (?, ?, ?, ?)", (wiki_page.pageid, wiki_page.title, digest, zlib.compress(encoded)))
+                self._docs += 1
+                indexed += 1
+            self._db.commit()
+        LOGGER.debug("Indexed %d pages.", indexed)
+        return indexed
+
+    def remove(self, pageid: int) -> bool:
+        """
+        Removes a page from the index.
+        @return True if it was indexed.
+        """
+        with self._lock:
+            removed = self._remove(pageid)
+            self._db.commit()
+        return removed
+
+    def search(self, query: str, limit=10) -> list:
+        """
+        Finds the pages that contain any of the words of query (case and diacritics are ignored), ranked by their BM25 score.
+        Words found in most pages are only looked for if the rarer words of query find fewer than limit pages.
+        @return list of up to limit SearchResult, from best to worst.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            # @optimization Terms found in most pages add almost nothing to the score (their idf is close to 0), but
+            # every page containing them would have to be scored. They are left out (if all terms are that common,
+            # only the least common one is looked for), unless the rest of the terms find fewer than limit pages.
+            frequencies = dict(self._db.execute(f"SELECT term, doc FROM vocab WHERE term IN ({','.join('?' * len(terms))})", terms).fetchall())
+            # @info Terms in no page can't match anything, so they don't count as rare terms
+            terms = [ term for term in terms if frequencies.get(term, 0) > 0 ]
+            if not terms:
+                return []
+            rare = [ term for term in terms if frequencies[term] <= COMMON_TERM_FRACTION * self._docs ] or [min(terms, key=lambda term: frequencies[term])]
+            res = self._search(rare, limit)
+            if len(res) < limit and len(rare) < len(terms):
+                res = self._search(terms, limit)
+        return [ SearchResult(pageid=pageid, title=title, score=score) for pageid, title, score in res ]
+
+    def optimize(self):
+        """
+        Merges all the segments of the index into one, making it as small and fast as it can be. It takes a while
+        on large indexes, so it's best done once many pages have been added.
+        """
+        with self._lock:
+            self._db.execute("INSERT INTO pages (pages) VALUES ('optimize')")
+            self._db.commit()
+
+    def __contains__(self, pageid: int) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM docs WHERE pageid = ?", (pageid,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._docs
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("INSERT INTO pages (pages) VALUES ('delete-all')")
+            self._db.execute("DELETE FROM docs")
+            self._db.commit()
+            self._docs = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _search(self, terms: list, limit: int) -> list:
+        # @info Every term is quoted, so nothing in it is taken as FTS5 syntax
+        match = " OR ".join(f'"{term}"' for term in terms)
+        return self._db.execute("""
+            SELECT docs.pageid, docs.title, -bm25(pages, ?, ?, ?) AS score
+            FROM pages JOIN docs ON docs.pageid = pages.rowid
+            WHERE pages MATCH ? ORDER BY score DESC LIMIT ?
+        """, (TITLE_WEIGHT, SUMMARY_WEIGHT, SECTIONS_WEIGHT, match, limit)).fetchall()
+
+    def _remove(self, pageid: int) -> bool:
+        row = self._db.execute("SELECT text FROM docs WHERE pageid = ?", (pageid,)).fetchone()
+        if row is None:
+            return False
+        text = json.loads(zlib.decompress(row[0]))
+        self._db.execute("INSERT INTO pages (pages, rowid, title, summary, sections) VALUES ('delete', ?, ?, ?, ?)", (pageid, *text))
+        self._db.execute("DELETE FROM docs WHERE pageid = ?", (pageid,))
+        self._docs -= 1
+        return True
@@ -0,0 +1,246 @@
+"""
+In-memory store of the pages found by an Enpyclopedia object.
+Pages are indexed by pageid, by title and by the titles of the pages redirecting to them,
+and the least recently used ones are evicted once the store grows over its limits.
+"""
+import dataclasses
+import itertools
+import logging
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+LOGGER = logging.getLogger(__name__)
+# @info Every PageStore, so the functions that fill the cached fields of a page can update the stores holding it
+_STORES = weakref.WeakSet()
+_STORES_LOCK = threading.Lock()
+
+def normalize_title(title: str) -> str:
+    """
+    Normalizes a title the same way MediaWiki does, so that 'potato_chip' and 'Potato chip' are the same page.
+    """
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+def _value_size(value) -> int:
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(_value_size(item) for item in value)
+    if dataclasses.is_dataclass(value):
+        return sys.getsizeof(value) + sum(_value_size(getattr(value, field.name)) for field in dataclasses.fields(value))
+    return 0 # Small numbers and booleans are shared
+
+def approximate_page_size(page) -> int:
+    """
+    Approximate amount of memory (in bytes) used by a WikipediaEntryPage and its cached fields, including the
+    elements of its lists (such as the text of its sections). Its html is stored compressed (rawhtml),
+    so it's counted as the bytes it takes.
+    """
+    return _value_size(page)
+
+def touch_page(page):
+    """
+    Updates every store holding page after its cached fields were filled (see PageStore.touch()).
+    The functions of Enpyclopedia call it whenever they fill a cached field.
+    """
+    with _STORES_LOCK:
+        stores = list(_STORES)
+    for store in stores:
+        store.touch(page)
+
+def touch_section(section):
+    """
+    Updates every store holding the page of a WikipediaSection after its text was filled (see touch_page()).
+    """
+    with _STORES_LOCK:
+        stores = list(_STORES)
+    for store in stores:
+        page = store.get(section.fromtitle, redirects=False)
+        if page is not None and any(s is section for s in page.sections or []):
+            store.touch(page)
+
+class PageStore:
+    """
+    Thread-safe store of WikipediaEntryPage objects with O(1) lookups by pageid or title,
+    and LRU eviction bounded by the amount of pages and/or their approximate memory usage.
+    For compatibility with the list it replaces, it can also be indexed by position
+    (pages[-1] is the most recently used page) and iterated from least to most recently used.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=approximate_page_size, on_evict=None, on_update=None):
+        """
+        @arg max_entries: Maximum amount of pages stored. None means no limit.
+        @arg max_bytes: Maximum approximate memory used by the pages stored. None means no limit.
+        @arg sizeof: Function returning the approximate size of a page.
+        @arg on_evict: Function called with every page evicted from the store.
+        @arg on_update: Function called with every page added to the store, and with every stored page touched.
+        Both functions are called once the store is unlocked, so they may take a while or use the store.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.on_update = on_update
+        self.evictions = 0
+        self._pages = OrderedDict() # pageid -> page, from least to most recently used
+        self._titles = {} # Normalized title (or alias) -> pageid
+        self._redirect_titles = {} # Normalized title of a redirect -> pageid of its target
+        self._keys = {} # pageid -> (titles, redirect titles) indexing it
+        self._sizes = {} # pageid -> approximate size
+        self._bytes = 0
+        self._lock = threading.RLock()
+        with _STORES_LOCK:
+            _STORES.add(self)
+
+    def add(self, page, aliases=()):
+        """
+        Stores a page, indexed by its pageid, title, redirects and any aliases given (such as un-normalized titles).
+        If a page with the same pageid was already stored, the stored one is kept and returned instead,
+        since it may already hold cached fields such as its sections.
+        @return The stored page.
+        """
+        with self._lock:
+            stored, evicted = self._add(page, aliases)
+        self._updated(stored, evicted)
+        return stored
+
+    def touch(self, page) -> bool:
+        """
+        Updates the size of a stored page (and the titles of the pages redirecting to it) after its cached fields
+        changed, evicting other pages if it has grown over the limits. Fields filled by the functions of
+        Enpyclopedia are counted automatically (see touch_page()), fields assigned by hand only once this is called.
+        @return True if the page is stored.
+        """
+        with self._lock:
+            if self._pages.get(page.pageid) is not page:
+                return False
+            stored, evicted = self._add(page, ())
+        self._updated(stored, evicted)
+        return True
+
+    def get(self, key, redirects=True):
+        """
+        Finds a page by pageid (int) or by title (str), and marks it as the most recently used.
+        @arg redirects: If True, titles of the pages redirecting to a stored page find that page too.
+        @return The page found, or None.
+        """
+        with self._lock:
+            if isinstance(key, int):
+                pageid = key
+            else:
+                title = normalize_title(key)
+                pageid = self._titles.get(title)
+                if pageid is None and redirects:
+                    pageid = self._redirect_titles.get(title)
+            page = self._pages.get(pageid)
+            if page is not None:
+                self._pages.move_to_end(pageid)
+            return page
+
+    def remove(self, key):
+        """
+        Removes a page (by pageid or title) from the store.
+        @return The page removed, or None if it wasn't stored.
+        """
+        with self._lock:
+            page = self.get(key, redirects=False)
+            if page is not None:
+                self._remove(page.pageid)
+            return page
+
+    def clear(self):
+        with self._lock:
+            for pageid in list(self._pages):
+                self._remove(pageid)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            if isinstance(key, int):
+                return key in self._pages
+            return normalize_title(key) in self._titles
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._pages.values()))
+
+    def __getitem__(self, index: int):
+        """
+        Positional access, from the least (0) to the most (-1) recently used page.
+        """
+        with self._lock:
+            if index < 0:
+                index += len(self._pages)
+            if index == len(self._pages) - 1 and self._pages:
+                return next(reversed(self._pages.values()))
+            if index < 0 or index >= len(self._pages):
+                raise IndexError("PageStore index out of range")
+            return next(itertools.islice(self._pages.values(), index, None))
+
+    def _add(self, page, aliases) -> tuple:
+        """
+        @return (stored page, pages evicted)
+        """
+        stored = self._pages.get(page.pageid)
+        if stored is None:
+            stored = page
+            self._pages[page.pageid] = page
+            self._keys[page.pageid] = (set(), set())
+        else:
+            self._pages.move_to_end(page.pageid)
+        titles, redirect_titles = self._keys[page.pageid]
+        for title in itertools.chain([page.title], aliases):
+            title = normalize_title(title)
+            self._titles[title] = page.pageid
+            titles.add(title)
+        for redirect in (page.redirects or []):
+            title = normalize_title(redirect.title)
+            self._redirect_titles[title] = page.pageid
+            redirect_titles.add(title)
+        self._update_size(stored)
+        return stored, self._evict()
+
+    def _updated(self, page, evicted: list):
+        for evicted_page in evicted:
+            self.on_evict(evicted_page)
+        if self.on_update is not None:
+            self.on_update(page)
+
+    def _update_size(self, page):
+        size = self.sizeof(page)
+        self._bytes += size - self._sizes.get(page.pageid, 0)
+        self._sizes[page.pageid] = size
+
+    def _remove(self, pageid: int):
+        page = self._pages.pop(pageid)
+        titles, redirect_titles = self._keys.pop(pageid)
+        for title in titles:
+            if self._titles.get(title) == pageid:
+                del self._titles[title]
+        for title in redirect_titles:
+            if self._redirect_titles.get(title) == pageid:
+                del self._redirect_titles[title]
+        self._bytes -= self._sizes.pop(pageid)
+        return page
+
+    def _evict(self) -> list:
+        """
+        @return The pages evicted that have to be passed to on_evict.
+        """
+        evicted = []
+        # @info The most recently used page is never evicted, even if it's over the limits by itself
+        while len(self._pages) > 1 and ((self.max_entries is not None and len(self._pages) > self.max_entries) or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            page = self._remove(next(iter(self._pages)))
+            self.evictions += 1
+            LOGGER.debug("Evicted page '%s' from the page store.", page.title)
+            if self.on_evict is not None:
+                evicted.append(page)
+        return evicted
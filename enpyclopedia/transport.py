@@ -0,0 +1,251 @@
+"""
+HTTP transport shared by all the requests Enpyclopedia makes to Wikipedia.
+Opening a new TCP+TLS connection for every request is expensive, so connections are
+kept alive in a pool that every thread (and every function) reuses.
+"""
+import json
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .cache import ResponseCache
+from .ratelimit import RateLimiter, get_default_rate_limiter
+from .metrics import Metrics, endpoint
+
+LOGGER = logging.getLogger(__name__)
+WIKI_API_URL = "https://en.wikipedia.org/w/api.php"
+USER_AGENT = "Enpyclopedia/0.5 (https://github.com/M-T3K/Enpyclopedia)"
+THROTTLE_STATUSES = (429, 503) # Responses meaning that the server wants us to slow down
+
+class WikipediaAPIError(Exception):
+    """
+    Error returned by the MediaWiki API, or a response that isn't a valid API response at all.
+    """
+
+    def __init__(self, code: str, info: str):
+        super().__init__(f"{code}: {info}")
+        self.code = code
+        self.info = info
+
+class _Flight:
+    """
+    Request in flight, whose result is shared by every thread that asks for the same request meanwhile.
+    """
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class WikipediaTransport:
+    """
+    Thread-safe HTTP transport with keep-alive connection pooling, retries with backoff,
+    timeouts, gzip compression, rate limiting, metrics and an optional persistent ResponseCache.
+    A single connection pool (the HTTPAdapter) is shared by all threads, while every thread
+    gets its own requests.Session on top of it, since Sessions themselves are not thread-safe.
+    Identical requests made at the same time by several threads are coalesced into a single one (single-flight).
+    """
+
+    def __init__(self, api_url=WIKI_API_URL, pool_size=10, max_retries=3, backoff_factor=0.5, timeout=(5, 30), user_agent=USER_AGENT, cache: ResponseCache = None, rate_limiter: RateLimiter = None, maxlag=5, metrics: Metrics = None):
+        """
+        @arg api_url: URL of the MediaWiki api.php endpoint used by query().
+        @arg pool_size: Maximum amount of connections kept alive per host.
+        @arg max_retries: Amount of times a failed request is retried before giving up.
+        @arg backoff_factor: Retries wait backoff_factor * 2^(retry - 1) seconds between attempts.
+        @arg timeout: Either a number of seconds or a (connect, read) tuple, as in requests.
+        @arg cache: ResponseCache used by query() and fetch() when they are given the revision of a page.
+        @arg rate_limiter: RateLimiter every request waits for. Defaults to the process-wide one (see get_default_rate_limiter()).
+        @arg maxlag: Seconds of database replication lag above which the API should refuse our queries (and we back off).
+        None disables it. See https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
+        @arg metrics: Metrics every request is recorded in. By default, the transport has its own.
+        """
+        self.api_url = api_url
+        self.timeout = timeout
+        self.cache = cache
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_default_rate_limiter()
+        self.maxlag = maxlag
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.headers = {"User-Agent": user_agent, "Accept-Encoding": "gzip, deflate"}
+        # @info Throttling responses (and lag) are retried by get() instead, so that the rate limiter learns about them
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=(500, 502, 504), allowed_methods=frozenset(["GET", "HEAD"]), respect_retry_after_header=False, raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self._local = threading.local()
+        self._flights = {} # Key of a request in flight -> _Flight
+        self._flights_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Session of the calling thread. All of them share the same pooled adapter.
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        """
+        Performs a GET request to any url using the pooled connections, once the rate limiter allows it.
+        If the server throttles the request (429/503) or reports too much lag, the host is slowed down
+        and the request is retried after the time the server asks for (Retry-After).
+        """
+        return self._request("GET", url, params, **kwargs)
+
+    def head(self, url: str, params=None, **kwargs) -> requests.Response:
+        """
+        Performs a HEAD request (only the headers of the response are transferred) in the same way as get().
+        """
+        return self._request("HEAD", url, params, **kwargs)
+
+    def _request(self, method: str, url: str, params=None, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        name = endpoint(url, params, self.api_url)
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(url)
+            start = time.perf_counter()
+            req = self.session.request(method, url, params=params, **kwargs)
+            # @info The size on the wire when known, since streamed bodies (images) must not be read here
+            size = 0 if method == "HEAD" else int(req.headers.get("Content-Length") or 0) or (0 if kwargs.get("stream") else len(req.content))
+            self.metrics.observe_request(name, time.perf_counter() - start, size, req.status_code)
+            LOGGER.info("Request URL: %s", req.url)
+            if req.status_code not in THROTTLE_STATUSES and req.headers.get("MediaWiki-API-Error") != "maxlag":
+                self.rate_limiter.succeed(url)
+                return req
+            self.metrics.observe_throttled(name)
+            self.rate_limiter.throttle(url, self._retry_after(req, attempt))
+            if attempt < self.max_retries:
+                req.close()
+        LOGGER.error("Giving up on %s after %d throttled attempts.", req.url, self.max_retries + 1)
+        return req
+
+    def _retry_after(self, req: requests.Response, attempt: int) -> float:
+        """
+        Seconds to wait before retrying a throttled request: the server's Retry-After, or exponential backoff.
+        """
+        try:
+            return float(req.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return self.backoff_factor * (2 ** attempt)
+
+    def query(self, params, revision: str = None) -> dict:
+        """
+        Performs a GET request to the MediaWiki API and returns the decoded JSON response.
+        @arg params: Either a dict or an already built query string.
+        @arg revision: Revision of the page the query is about (see cache.page_revision()). Only requests
+        given a revision are cached, since their response is known to be valid while the page is unchanged.
+        @raise WikipediaAPIError if the API returns an error, or something that isn't an API response.
+        """
+        if self.maxlag is not None:
+            params = f"{params}&maxlag={self.maxlag}" if isinstance(params, str) else {**params, "maxlag": self.maxlag}
+        return self._single_flight(self.api_url, params, revision, lambda: self._query(params, revision))
+
+    def _query(self, params, revision: str) -> dict:
+        key = self._cache_key(self.api_url, params, revision)
+        if key is not None:
+            body = self.cache.get(key, revision)
+            self.metrics.observe_cache(endpoint(self.api_url, params, self.api_url), body is not None)
+            if body is not None:
+                return json.loads(body)
+        req = self.get(self.api_url, params=params)
+        try:
+            res = req.json()
+        except ValueError:
+            raise WikipediaAPIError(f"http-{req.status_code}", f"The response to {req.url} is not a valid API response.")
+        if "error" in res:
+            raise WikipediaAPIError(res["error"].get("code"), res["error"].get("info"))
+        if key is not None and req.ok:
+            self.cache.set(key, req.content, revision)
+        return res
+
+    def fetch(self, url: str, params=None, revision: str = None) -> bytes:
+        """
+        Returns the body of a GET request to any url, using the cache in the same way as query().
+        @raise WikipediaAPIError if the response isn't successful (its code is "http-" followed by the status).
+        """
+        return self._single_flight(url, params, revision, lambda: self._fetch(url, params, revision))
+
+    def _fetch(self, url: str, params, revision: str) -> bytes:
+        key = self._cache_key(url, params, revision)
+        if key is not None:
+            body = self.cache.get(key, revision)
+            self.metrics.observe_cache(endpoint(url, params, self.api_url), body is not None)
+            if body is not None:
+                return body
+        req = self.get(url, params=params)
+        # @info Error pages (or throttled responses, once the retries run out) must not be taken as the requested content
+        if not req.ok:
+            raise WikipediaAPIError(f"http-{req.status_code}", f"The request to {req.url} failed with status {req.status_code} {req.reason}.")
+        if key is not None:
+            self.cache.set(key, req.content, revision)
+        return req.content
+
+    def _single_flight(self, url: str, params, revision: str, request):
+        """
+        Calls request(), unless an identical request is already in flight: then its result (or its exception) is shared instead.
+        Results are shared as they are, so callers must not modify them.
+        """
+        key = (ResponseCache.key_for(url, params), revision)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            self.metrics.observe_coalesced(endpoint(url, params, self.api_url))
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = request()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _cache_key(self, url: str, params, revision: str) -> str:
+        if self.cache is None or revision is None:
+            return None
+        return ResponseCache.key_for(url, params)
+
+    def close(self):
+        """
+        Closes all the pooled connections.
+        """
+        self.adapter.close()
+
+# @info The default transport is used by every function that isn't given one explicitly
+_DEFAULT_TRANSPORT = None
+_DEFAULT_TRANSPORT_LOCK = threading.Lock()
+
+def get_default_transport() -> WikipediaTransport:
+    """
+    Returns the process-wide transport, creating it the first time it's needed.
+    """
+    global _DEFAULT_TRANSPORT
+    if _DEFAULT_TRANSPORT is None:
+        with _DEFAULT_TRANSPORT_LOCK:
+            if _DEFAULT_TRANSPORT is None:
+                _DEFAULT_TRANSPORT = WikipediaTransport()
+    return _DEFAULT_TRANSPORT
+
+def set_default_transport(transport: WikipediaTransport):
+    """
+    Replaces the process-wide transport used by functions that aren't given one explicitly.
+    """
+    global _DEFAULT_TRANSPORT
+    with _DEFAULT_TRANSPORT_LOCK:
+        _DEFAULT_TRANSPORT = transport
@@ -0,0 +1,102 @@
+from enpyclopedia import *
+from enpyclopedia.export import CHECKPOINT_FILE, DEFAULT_EXPORT_FIELDS, FAILED_FILE, export_pages
+from benchmarks.mockwiki import MockWiki, generate_fixtures
+from enpyclopedia.store import normalize_title
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+# Offline check of resuming an export: an export is interrupted partway, what it wrote after its last checkpoint is
+# corrupted, and it's resumed. Every page must end up exported exactly once. It runs against the local MockWiki server.
+
+class FlakyWiki(MockWiki):
+    """
+    MockWiki whose parse requests fail for some pages, and which remembers the pages that were parsed.
+    """
+
+    def __init__(self, fixtures: dict, failing: set):
+        super().__init__(fixtures)
+        self.failing = failing
+        self.parsed = []
+
+    def parse(self, q: dict) -> dict:
+        title = normalize_title(q.get("page", ""))
+        self.parsed.append(title)
+        if title in self.failing:
+            return {"error": {"code": "internal_api_error", "info": "Failed on purpose."}}
+        return super().parse(q)
+
+logging.basicConfig(level=logging.CRITICAL)
+fixtures = generate_fixtures(pages=200, sections=3, images=0, seed=2)
+pages = [ page["title"] for page in fixtures["pages"] if page["ns"] == 0 ]
+titles = [ title if i % 10 else f"Missing page {i}" for i, title in enumerate(pages) ]
+failing = { title for title in titles[3::17] if title in pages }
+exported = { title for title in titles if title in pages and title not in failing }
+wiki = FlakyWiki(fixtures, failing).start()
+directory = tempfile.mkdtemp()
+STOP_AFTER = 180
+
+def check(condition: bool, message: str):
+    if not condition:
+        logging.critical(message)
+        exit(1)
+
+def interrupted(titles: list):
+    yield from titles[:STOP_AFTER]
+    raise KeyboardInterrupt
+
+def export(titles) -> dict:
+    enc = Enpyclopedia(api_url=wiki.api_url, max_pages=10 * WIKI_MAX_TITLES)
+    try:
+        return export_pages(titles, directory, DEFAULT_EXPORT_FIELDS, workers=1, shard_size=40, enc=enc)
+    finally:
+        enc.transport.close()
+
+def read_shards() -> list:
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, "pages-*.jsonl.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            shard = [ json.loads(line) for line in f ]
+        check(len(shard) <= 40, f"Shard {path} has {len(shard)} records.")
+        records += shard
+    return records
+
+# The export is interrupted after some batches were written
+try:
+    export(interrupted(titles))
+    check(False, "The export was not interrupted.")
+except KeyboardInterrupt:
+    pass
+with open(os.path.join(directory, CHECKPOINT_FILE), encoding="utf-8") as f:
+    checkpoint = json.load(f)
+done = titles[:checkpoint["titles"]]
+check(0 < checkpoint["titles"] < STOP_AFTER and checkpoint["shard"] > 0, f"Unexpected checkpoint {checkpoint}.")
+check([ r["title"] for r in read_shards() ] == [ t for t in done if t in exported ], "The shards don't match the checkpoint.")
+
+# Writes that happened after the checkpoint, which the resumed export must discard
+with open(os.path.join(directory, f"pages-{checkpoint['shard']:05d}.jsonl.gz"), "ab") as f:
+    f.write(gzip.compress((json.dumps({"title": titles[-1]}) + "\n").encode("utf-8")))
+with open(os.path.join(directory, FAILED_FILE), "ab") as f:
+    f.write(f"{titles[-1]}\n".encode("utf-8"))
+
+wiki.parsed.clear()
+stats = export(titles)
+check(stats == {"titles": len(titles), "records": len(exported), "missing": sum(t not in pages for t in titles),
+                "failed": len(failing)}, f"Wrong stats {stats}.")
+check(not set(wiki.parsed) & set(done), "Pages that were already exported were retrieved again.")
+records = [ r["title"] for r in read_shards() ]
+check(len(records) == len(set(records)), f"Duplicated records: {sorted(t for t in set(records) if records.count(t) > 1)}.")
+check(set(records) == exported, f"Missing records: {sorted(exported - set(records))}, unexpected records: {sorted(set(records) - exported)}.")
+check(records == [ t for t in titles if t in exported ], "Records are not in the order of the titles.")
+check(all(r["sections"] is not None and r["summary"] is not None for r in read_shards()), "Some records don't have all their fields.")
+with open(os.path.join(directory, FAILED_FILE), encoding="utf-8") as f:
+    failed = f.read().splitlines()
+check(sorted(failed) == sorted(failing), f"Wrong failed titles {failed}.")
+
+wiki.stop()
+shutil.rmtree(directory)
+print("All export checks passed.")
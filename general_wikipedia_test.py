@@ -40,7 +40,7 @@ for elem in queries:
     if txt == None:
         logging.error("An error ocurred retrieving the text of page '%s' .", elem)
         exit(1)
-    wikitxt = get_wiki_text(wiki_data=wiki, type="wikitext")
+    wikitxt = get_wiki_text(wiki_data=wiki, type_text="wikitext")
     if txt == None:
         logging.error("An error ocurred retrieving the text of page '%s' with type 'wikitext'.", elem)
         exit(1)
@@ -51,13 +51,13 @@ for elem in queries:
         exit(1)
     print(sections)
     for s in sections:
-        txt = get_wiki_text(s, type="text")
+        txt = get_wiki_text(s, type_text="text")
         # Logically, either one of these fail, or none fail, because a wikipedia page MUST have both of these
         if txt == None: 
-            logging.error("An error ocurred retrieving the text of section '%s' with type 'wikitext'.", s.title)
+            logging.error("An error ocurred retrieving the text of section '%s' with type 'text'.", s.line)
             exit(1)
         print(txt)
-        print(get_wiki_text(s, type="wikitext"))
+        print(get_wiki_text(s, type_text="wikitext"))
     categories = get_categories(wiki_page=wiki)
     print(categories)
     for cat in categories:
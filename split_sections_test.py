@@ -0,0 +1,40 @@
+from enpyclopedia import *
+from benchmarks.mockwiki import MockWiki, generate_fixtures
+import dataclasses
+import logging
+import re
+
+# Offline check of split_sections(): the text of every section, split locally from the text of the whole page,
+# must be the same as the text the API returns for that section alone. It runs against the local MockWiki server.
+
+logging.basicConfig(level=logging.ERROR)
+wiki = MockWiki(generate_fixtures(pages=10, sections=12, seed=1)).start()
+enc = Enpyclopedia(api_url=wiki.api_url, max_pages_bytes=10 ** 9)
+# @info Sections of the API are wrapped in a content div whose class varies, split sections in a fixed one
+WRAPPER_RE = re.compile(r'^<div\b[^>]*>(.*)</div>$', re.DOTALL)
+
+def check(condition: bool, message: str):
+    if not condition:
+        logging.error(message)
+        exit(1)
+
+def content(html: str) -> str:
+    return WRAPPER_RE.match(html.strip()).group(1).strip()
+
+titles = [ page["title"] for page in generate_fixtures(pages=10, sections=12, seed=1)["pages"] if page["ns"] == 0 ]
+for title in titles:
+    page = enc.find(title)
+    size = enc.pages.bytes
+    sections = split_sections(page, "wikitext", enc.transport)
+    check(sections is not None and len(sections) == 12, f"Wrong sections of page '{title}': {sections}.")
+    check(enc.pages.bytes > size + sum(len(s.wikitext) for s in sections), f"The split text of page '{title}' isn't counted in the size of the store.")
+    split_sections(page, "text", enc.transport)
+    for section in sections:
+        single = dataclasses.replace(section, text=None, wikitext=None) # The same section, without its split text
+        wikitext = get_wiki_text(single, "wikitext", enc.transport)
+        check(section.wikitext == wikitext, f"The wikitext of section '{section.line}' of page '{title}' is not the one returned by the API:\n{section.wikitext!r}\n{wikitext!r}")
+        html = get_wiki_text(single, "text", enc.transport)
+        check(content(section.text) == content(html), f"The html of section '{section.line}' of page '{title}' is not the one returned by the API:\n{section.text!r}\n{html!r}")
+
+wiki.stop()
+print("All split_sections checks passed.")